@@ -1,250 +1,145 @@
+""" Kommandozeile für die Crawler.
+
+Die schweren Abhängigkeiten (Prefect, crawl4ai, Google API, pydantic) werden erst
+importiert, wenn ein Lauf tatsächlich startet.  `list`, `plan` und `report` kommen ohne
+sie aus und starten entsprechend schnell. """
 import asyncio
-import importlib
 import json
 import os
-import pkgutil
 import sys
-import textwrap
-from typing import Type
-
-import dotenv
-from googleapiclient.discovery import build
-from prefect import flow, tags, task
-from prefect.artifacts import create_markdown_artifact
-from prefect.cache_policies import INPUTS, TASK_SOURCE
-from prefect.logging import get_run_logger
-from prefect.runtime import task_run
-
-import definitions
-from definitions.base import BaseDefinition
-from tasks.scraper import scrape_url
-
-
-@task
-def get_done_combos(output_file: str, keys: tuple) -> set[tuple]:
-    combos_done = set()
-    if os.path.exists(output_file):
-        with open(output_file, "r", encoding="utf-8") as f:
-            objs = [json.loads(line) for line in f]
-            for obj in objs:
-                values = tuple(obj.get(k, "") for k in keys)
-                if all(values):
-                    combos_done.add(values)
-    return combos_done
-
-
-@task(cache_policy=TASK_SOURCE+INPUTS, log_prints=True, tags=['google-search'])
-def google_search(query: str) -> list[str]:
-    """ Führt eine Google-Suche aus und gibt eine Liste von URLs zurück. """
-
-    log = get_run_logger()
-    log.info("Searching for %s...", query)
-    api_key = dotenv.get_key(".env", "GOOGLE_API_KEY")
-    cse_id = dotenv.get_key(".env", "GOOGLE_CSE_ID")
-    if not api_key or not cse_id:
-        log.error("Missing GOOGLE_API_KEY or GOOGLE_CSE_ID in .env file")
-        return []
-    service = build("customsearch", "v1", developerKey=api_key)
-    res = service.cse().list(q=query, cx=cse_id, num=10).execute()  # pylint: disable=E1101
-
-    if len(res.get('items', [])) == 0:
-        log.warning("No results found for query: %s", query)
-        log.warning("response: %s", res)
-
-    return [item.get('link', '') for item in res.get('items', []) if 'link' in item]
-
-
-def get_definition_class(modulename: str) -> Type[BaseDefinition]:
-    """ Findet eine Crawler-Definition nach dem Namen der Python-Datei.  Es wird die Klasse
-        als Typ zurückgegeben.  Wenn keine Definition gefunden wird, wird ein ValueError
-        ausgelöst. """
-    mod = importlib.import_module(f"definitions.{modulename}")
-    for name in dir(mod):
-        obj = getattr(mod, name)
-        if isinstance(obj, type) and issubclass(obj, BaseDefinition) and obj is not BaseDefinition:
-            print(f"Found definition class: {name}")
-            return obj
-    raise ValueError(f"No definition class found in {modulename}")
-
-
-@flow(log_prints=True)
-async def baseline(modulename: str) -> None:
-    log = get_run_logger()
-
-    mod = get_definition_class(modulename)
-    output_file = mod.output_file
-    combo_keys = mod.combo_keys
-    query_template = mod.query_template
-    prompt_template = mod.prompt_template
-    load_institutions = mod.load_institutions
-    make_combos = mod.make_combos
+from collections import Counter
+
+from definitions.registry import list_definitions, load_definition
+
+
+def usage(modules: list[str]):
+    """ Gibt die Verwendung des Skriptes aus. """
+    print("Usage: python baseline.py <modulename> [--workers N]")
+    print("       python baseline.py list")
+    print("       python baseline.py plan <modulename> [--workers N]")
+    print("       python baseline.py report <modulename>")
+    print("       python baseline.py batch-prepare <modulename>")
+    print("       python baseline.py batch-stub <modulename>")
+    print("       python baseline.py batch-ingest <modulename> [<batch output file>]")
+    print("Where <modulename> is one of the following:")
+    for name in modules:
+        print(f"  - {name}")
+
+
+def list_command(modules: list[str]):
+    """ Listet alle Crawler-Definitionen mit Ausgabedatei und Kombinationsschlüsseln auf. """
+    for name in modules:
+        mod = load_definition(name)
+        print(f"{name}: {', '.join(mod.combo_keys)} -> {mod.output_file}")
+
+
+def plan_command(modulename: str, workers: int = 1):
+    """ Schätzt Suchanfragen, Seiten, Tokens, Kosten und Dauer eines Laufs mit `workers`
+        Prozessen. """
+    from plan import format_plan, make_plan
+    from store import ResultStore
 
+    store = ResultStore()
     try:
-        unis = load_institutions()
-        unis_dict = {uni["name"]: uni for uni in unis}
+        print(format_plan(make_plan(modulename, store), workers=workers))
     except FileNotFoundError as e:
-        log.error(e)
+        print(e)
+        sys.exit(1)
+    finally:
+        store.close()
+
+
+def report_command(modulename: str):
+    """ Gibt eine kurze Zusammenfassung der bisherigen Ergebnisse eines Crawlers aus. """
+    mod = load_definition(modulename)
+    if not os.path.exists(mod.output_file):
+        print(f"No results yet ({mod.output_file} does not exist)")
         return
 
-    # Filter: only universities with "Humboldt" in name
-    # unis = [uni for uni in unis if "Humboldt" in uni["name"]]
-
-    uni_names = [uni['name'] for uni in unis]
-    all_combos = make_combos(uni_names)
-
-    combos_done = get_done_combos(output_file, keys=combo_keys)
-    combos_todo = all_combos - combos_done
-
-    print("Total of %d inputs", len(all_combos))
-    print("Already done: %d", len(combos_done))
-    print("Remaining: %d", len(combos_todo))
-
-    # # Limit to 10 combos
-    # combos_todo = list(combos_todo)[:10]
-
-    jobs = []
-    for i, combo in enumerate(combos_todo):
-        arguments = dict(zip(combo_keys, combo))
-        einrichtung = arguments["einrichtung"]
-        item = unis_dict[einrichtung]
-
-        values: dict = arguments.copy()
-        values.update(item)
-
-        query = query_template.format(**values)
-        print(f"Processing {i + 1}/{len(combos_todo)}: {combo}")
-
-        job = handle_uni(query, prompt_template=prompt_template,
-                         arguments=arguments, output_file=output_file)
-        jobs.append(job)
-
-    # Führe alle Aufgaben parallel aus
-    await asyncio.gather(*jobs)
-
-
-def _handle_uni_task_name():
-    task_name = task_run.task_name
-    parameters = task_run.parameters
-    arguments = parameters.get("arguments", {})
-
-    new_name = task_name
-    for v in arguments.values():
-        new_name += '-' + str(v)
-    new_name = new_name.replace(" ", "-").lower()
-    return new_name
-
-
-@task(log_prints=True, task_run_name=_handle_uni_task_name, tags=['handle-uni'])
-async def handle_uni(query: str, prompt_template: str, arguments: dict[str, str], output_file: str) -> dict:
-    """ Behandelt eine Institution mit einer Suchabfrage und einem bestimmten Prompt. """
-
-    # Google search
-    urls = google_search(query)
-
-    combined_verdict = False
-    scraping_results = []
-    urls = urls[:5]
-
-    for url in urls:
-        result = await scrape_url(url=url,
-                                  prompt_template=prompt_template,
-                                  arguments=arguments)
-
-        scraping_results.append(result)
-        if result.result:
-            combined_verdict = True
-            # exit early
-            break
-
-    # Create prefect artifact (markdown report)
-    prompt = prompt_template.format(**arguments)
-    args_markdown = "\n".join(f"    - {k}: {v}" for k, v in arguments.items())
-    markdown = textwrap.dedent(f"""\
-        # handle_uni results
-        - **Query:** {query}
-        - **Prompt:**
-        {textwrap.indent(prompt, "  ")}
-        - **Arguments:**
-        {args_markdown}
-        - **Result:** {combined_verdict}
-        - **Reasoning:**
-        
-        ## Inputs:
-        Analyzed the following URLs:
-        """)
-
-    for url, result in zip(urls, scraping_results):
-        markdown += textwrap.dedent(f"""\
-            - **URL:** {url}
-              **Result:** {result.result}
-              **Reasoning:** {result.reasoning}
-            """)
-
-    description = f"Results for {arguments['einrichtung']}"
-
-    await create_markdown_artifact(
-        markdown=markdown,
-        key="handle-uni-results",
-        description=description
-    )  # type: ignore
-
-    # Return result as JSON
-    combined_inputs = [
-        {"url": url, "result": result.result, "reasoning": result.reasoning}
-        for url, result in zip(urls, scraping_results)
-    ]
-
-    if not combined_verdict:
-        summary = "No evidence found"
-    else:
-        summary = "Evidence found"
+    with open(mod.output_file, "r", encoding="utf-8") as f:
+        objs = [json.loads(line) for line in f]
 
-    res_item: dict = {
-        "result": combined_verdict,
-    }
-    res_item.update(arguments)
-    res_item['reasoning'] = {
-        'summary': summary,
-        'inputs': combined_inputs,
-    }
+    print(f"{len(objs)} results in {mod.output_file}")
+    print(f"  positive: {sum(1 for obj in objs if obj.get('result'))}")
+    for key in mod.combo_keys[1:]:
+        counts = Counter(obj.get(key, "") for obj in objs if obj.get("result"))
+        for value in mod.options[key]:
+            print(f"  positive for {key}={value}: {counts[value]}")
 
-    with open(output_file, "a", encoding='utf-8') as f:
-        f.write(json.dumps(res_item, ensure_ascii=False) + "\n")
 
-    return res_item
+def run_command(modulename: str, workers: int = 1):
+    """ Startet einen Crawler-Lauf, mit `workers` > 1 verteilt auf mehrere Prozesse. """
+    from prefect import tags
 
+    if workers > 1:
+        from flows.workers import baseline_coordinator
 
-def list_modules() -> list[str]:
-    """ Listet alle verfügbaren Crawler-Definitionen auf. """
-    return [
-        module.name
-        for module in pkgutil.iter_modules(definitions.__path__)
-        if module.name != "base"
-    ]
+        with tags("baseline"):
+            baseline_coordinator(modulename, workers)
+        return
 
+    from flows.baseline import baseline
 
-def usage(modules: list[str]):
-    """ Gibt die Verwendung des Skriptes aus. """
-    print("Usage: python baseline.py <modulename>")
-    print("Where <modulename> is one of the following:")
-    for name in modules:
-        print(f"  - {name}")
+    with tags("baseline"):
+        asyncio.run(baseline(modulename))
 
 
-def main():
-    modules = list_modules()
-    if len(sys.argv) != 2:
-        usage(modules)
-        sys.exit(1)
+def batch_prepare_command(modulename: str):
+    """ Schreibt die Anfragen eines Batch-Laufs (Phase 1). """
+    from prefect import tags
+
+    from flows.batch import batch_prepare
+
+    with tags("batch"):
+        asyncio.run(batch_prepare(modulename))
+
+
+def batch_stub_command(modulename: str):
+    """ Arbeitet die Batch-Datei lokal gegen `LLM_BASE_URL` ab. """
+    from flows.batch import batch_files, run_batch_stub
 
-    modulename = sys.argv[1]
-    if modulename not in list_modules():
+    batch_file, _, batch_output_file = batch_files(modulename)
+    run_batch_stub(batch_file, batch_output_file)
+
+
+def batch_ingest_command(modulename: str, batch_output_file: str | None = None):
+    """ Wertet die Ausgabedatei eines Batch-Laufs aus (Phase 2). """
+    from prefect import tags
+
+    from flows.batch import batch_ingest
+
+    with tags("batch"):
+        batch_ingest(modulename, batch_output_file)
+
+
+def main():
+    modules = list_definitions()
+    args = sys.argv[1:]
+
+    if args == ["list"]:
+        list_command(modules)
+    elif len(args) == 2 and args[0] == "plan" and args[1] in modules:
+        plan_command(args[1])
+    elif (len(args) == 4 and args[0] == "plan" and args[1] in modules and args[2] == "--workers"
+          and args[3].isdigit() and int(args[3]) > 0):
+        plan_command(args[1], workers=int(args[3]))
+    elif len(args) == 2 and args[0] == "report" and args[1] in modules:
+        report_command(args[1])
+    elif len(args) == 2 and args[0] == "batch-prepare" and args[1] in modules:
+        batch_prepare_command(args[1])
+    elif len(args) == 2 and args[0] == "batch-stub" and args[1] in modules:
+        batch_stub_command(args[1])
+    elif len(args) in (2, 3) and args[0] == "batch-ingest" and args[1] in modules:
+        batch_ingest_command(*args[1:])
+    elif len(args) == 1 and args[0] in modules:
+        run_command(args[0])
+    elif (len(args) == 3 and args[0] in modules and args[1] == "--workers"
+          and args[2].isdigit() and int(args[2]) > 0):
+        run_command(args[0], workers=int(args[2]))
+    else:
         usage(modules)
         sys.exit(1)
 
-    with tags("baseline"):
-        asyncio.run(baseline(modulename))
-
 
 if __name__ == "__main__":
     main()
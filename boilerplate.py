@@ -0,0 +1,80 @@
+""" Entfernt wiederkehrende Blöcke (Navigation, Cookie-Banner, Footer) aus dem Markdown,
+bevor es an das LLM geht.
+
+Seiten derselben Hochschule teilen sich große Teile ihres Markdowns.  Der Filter merkt sich
+pro Domain, auf wie vielen Seiten ein Block (Absatz) schon vorkam, und entfernt Blöcke, die
+auf mindestens `min_pages` Seiten gesehen wurden.  Blöcke, die einen der Suchbegriffe
+einer Kombination enthalten (z.B. einen Menüpunkt "Moodle-Login"), bleiben erhalten, da sie
+gerade der gesuchte Hinweis sein können.  Was als Boilerplate gilt, hängt davon ab, welche
+Seiten vorher geladen wurden; das Entfernen ist daher pro Definition abschaltbar
+(`strip_boilerplate`).
+
+Zusätzlich werden Chunks, die für eine Kombination schon einmal bewertet wurden, nicht
+erneut an das LLM gegeben. """
+import hashlib
+import re
+import threading
+from collections import Counter, defaultdict
+from urllib.parse import urlsplit
+
+
+def domain_of(url: str) -> str:
+    """ Gibt den Hostnamen einer URL ohne führendes "www." zurück. """
+    host = urlsplit(url).hostname or ""
+    return host.removeprefix("www.")
+
+
+def _fingerprint(text: str) -> str:
+    normalized = re.sub(r"\s+", " ", text).strip().lower()
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+
+class BoilerplateFilter:
+    """ Lernt wiederkehrende Blöcke pro Domain während eines Laufs.  Eine Instanz wird von
+        allen Tasks eines Prozesses geteilt, daher sind alle Methoden threadsicher. """
+
+    def __init__(self, min_pages: int = 3):
+        self.min_pages = min_pages
+        self._lock = threading.Lock()
+        # domain -> bereits gezählte URLs
+        self._pages: dict[str, set[str]] = defaultdict(set)
+        # domain -> Fingerprint -> Anzahl Seiten, auf denen der Block vorkam
+        self._block_counts: dict[str, Counter] = defaultdict(Counter)
+        # Kombination -> Fingerprints der bereits bewerteten Chunks
+        self._seen_chunks: dict[tuple, set[str]] = defaultdict(set)
+
+    def strip(self, url: str, blocks: list[str], keep_terms: list[str] = ()) -> list[str]:
+        """ Zählt die Blöcke einer Seite und gibt nur die Blöcke zurück, die auf dieser
+            Domain (noch) nicht als Boilerplate gelten oder einen der `keep_terms`
+            enthalten.  Leere Blöcke fallen weg. """
+        domain = domain_of(url)
+        terms = [term.casefold() for term in keep_terms if term]
+        fingerprints = [_fingerprint(block) for block in blocks]
+
+        with self._lock:
+            counts = self._block_counts[domain]
+            if url not in self._pages[domain]:
+                self._pages[domain].add(url)
+                counts.update(set(fingerprints))
+
+            return [block for block, fp in zip(blocks, fingerprints)
+                    if block.strip() and (counts[fp] < self.min_pages
+                                          or any(term in block.casefold() for term in terms))]
+
+    def dedupe_chunks(self, combo: tuple, chunks: list[str]) -> list[str]:
+        """ Entfernt Chunks, die für diese Kombination bereits (auf einer anderen URL)
+            an das LLM gegeben wurden. """
+        with self._lock:
+            seen = self._seen_chunks[combo]
+            unique = []
+            for chunk in chunks:
+                fp = _fingerprint(chunk)
+                if fp not in seen:
+                    seen.add(fp)
+                    unique.append(chunk)
+            return unique
+
+    def forget_combo(self, combo: tuple):
+        """ Vergisst die Chunks einer Kombination, sobald sie fertig ist. """
+        with self._lock:
+            self._seen_chunks.pop(combo, None)
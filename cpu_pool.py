@@ -0,0 +1,103 @@
+""" Prozess-Pool für die CPU-lastigen Schritte eines Laufs.
+
+Markdown-Erzeugung, PDF-Textextraktion und das Zusammenfassen der Abschnitte zu Chunks
+würden sonst auf dem Thread der Event-Loop laufen und alle gleichzeitigen Netzwerkzugriffe
+aufhalten.  Die Funktionen hier laufen in eigenen Prozessen und geben nur Text zurück.
+Die Anzahl der Prozesse kann mit `CPU_WORKERS` in der .env-Datei eingestellt werden
+(Standard: Anzahl der Kerne). """
+import asyncio
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+from io import BytesIO
+from typing import Callable, TypeVar
+
+import dotenv
+
+T = TypeVar("T")
+
+# Obergrenzen für PDFs, damit ein riesiges Dokument nicht den Speicher eines Pool-Prozesses
+# sprengt (z.B. ein Vorlesungsverzeichnis mit tausenden Seiten)
+MAX_PDF_BYTES = 50 * 1024 * 1024
+MAX_PDF_PAGES = 300
+
+_pool: ProcessPoolExecutor | None = None
+# Überschreibt CPU_WORKERS, z.B. wenn sich mehrere Worker-Prozesse die Kerne teilen
+_max_workers: int | None = None
+
+
+def cpu_workers() -> int:
+    """ Anzahl der Prozesse laut `CPU_WORKERS`, sonst die Anzahl der Kerne. """
+    workers = dotenv.get_key(".env", "CPU_WORKERS")
+    return int(workers) if workers else (os.cpu_count() or 1)
+
+
+def configure_pool(max_workers: int) -> None:
+    """ Legt die Größe des Pools fest.  Muss vor dem ersten get_pool() aufgerufen werden. """
+    global _max_workers
+    _max_workers = max_workers
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """ Gibt den Prozess-Pool dieses Prozesses zurück und legt ihn beim ersten Aufruf an. """
+    global _pool
+    if _pool is None:
+        # "spawn", da der aufrufende Prozess Threads und eine laufende Event-Loop hat
+        _pool = ProcessPoolExecutor(max_workers=_max_workers or cpu_workers(),
+                                    mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    global _pool
+    # Nur ersetzen, wenn nicht schon ein anderer Aufruf einen neuen Pool angelegt hat
+    if _pool is pool:
+        _pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_in_pool(func: Callable[..., T], *args, **kwargs) -> T:
+    """ Führt `func` im Prozess-Pool aus, ohne die Event-Loop zu blockieren.  Ist der Pool
+        kaputt, weil ein Prozess abgestürzt ist (z.B. wegen Speichermangels), wird er neu
+        angelegt und der Aufruf einmal wiederholt. """
+    loop = asyncio.get_running_loop()
+    call = partial(func, *args, **kwargs)
+    pool = get_pool()
+    try:
+        return await loop.run_in_executor(pool, call)
+    except BrokenProcessPool:
+        _discard_pool(pool)
+        return await loop.run_in_executor(get_pool(), call)
+
+
+def html_to_markdown(html: str, base_url: str) -> str:
+    """ Erzeugt Markdown aus bereinigtem HTML, wie crawl4ai es sonst selbst tun würde. """
+    from crawl4ai import DefaultMarkdownGenerator
+
+    result = DefaultMarkdownGenerator().generate_markdown(input_html=html, base_url=base_url)
+    return result.raw_markdown
+
+
+def pdf_to_text(data: bytes) -> str:
+    """ Extrahiert den Text der ersten `MAX_PDF_PAGES` Seiten eines PDFs, eine Seite pro
+        Absatz. """
+    from PyPDF2 import PdfReader
+
+    reader = PdfReader(BytesIO(data))
+    pages = itertools.islice(reader.pages, MAX_PDF_PAGES)
+    return "\n\n".join(page.extract_text() or "" for page in pages)
+
+
+def merge_chunks(documents: list[str], chunk_token_threshold: int, overlap: int,
+                 word_token_rate: float) -> list[str]:
+    """ Fasst Abschnitte zu Chunks von etwa `chunk_token_threshold` Tokens zusammen
+        (wie LLMExtractionStrategy._merge). """
+    from crawl4ai.utils import merge_chunks as _merge_chunks
+
+    return _merge_chunks(docs=documents,
+                         target_size=chunk_token_threshold,
+                         overlap=overlap,
+                         word_token_ratio=word_token_rate)
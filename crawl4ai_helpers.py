@@ -1,27 +1,301 @@
 import logging
 log = logging.getLogger(__name__)
 
+import json
+from concurrent.futures import ThreadPoolExecutor
+
 from crawl4ai import LLMExtractionStrategy
+from crawl4ai.markdown_generation_strategy import MarkdownGenerationStrategy
+from crawl4ai.models import MarkdownGenerationResult, TokenUsage
+from crawl4ai.prompts import PROMPT_EXTRACT_SCHEMA_WITH_INSTRUCTION
+from crawl4ai.utils import (escape_json_string, perform_completion_with_backoff,
+                            sanitize_html, sanitize_input_encode)
+from pydantic import BaseModel, ValidationError
+
+from boilerplate import BoilerplateFilter
+from llm_json import repair_json
+from utils import MAX_CHUNKS, global_limit
+
+# Prompt for structured output: the format is enforced through response_format, so
+# unlike crawl4ai's prompt it neither repeats the schema nor asks for <blocks> tags
+PROMPT_EXTRACT_STRUCTURED = """Here is the content from the URL:
+<url>{URL}</url>
+
+<url_content>
+{HTML}
+</url_content>
+
+{REQUEST}"""
+
+# Providers that rejected response_format json_schema; they get crawl4ai's prompt instead
+_no_structured_output: set[str] = set()
+
+
+def _rejects_structured_output(error) -> bool:
+    """Whether a BadRequestError means the provider does not support response_format,
+    as opposed to a problem with this particular chunk (too long, content filter)"""
+    from litellm.exceptions import (ContentPolicyViolationError, ContextWindowExceededError,
+                                    UnsupportedParamsError)
+
+    if isinstance(error, UnsupportedParamsError):
+        return True
+    if isinstance(error, (ContextWindowExceededError, ContentPolicyViolationError)):
+        return False
+    message = str(error).lower()
+    return any(term in message for term in ("response_format", "json_schema", "structured output"))
+
+
+class DeferredMarkdownGenerator(MarkdownGenerationStrategy):
+    """Skips markdown generation inside the crawler.  The markdown is generated from
+    `cleaned_html` afterwards, in the process pool (see cpu_pool.html_to_markdown)."""
+
+    def generate_markdown(self, input_html, base_url="", html2text_options=None,
+                          content_filter=None, citations=True, **kwargs):
+        return MarkdownGenerationResult(raw_markdown="", markdown_with_citations="",
+                                        references_markdown="")
 
 
 class ChunkLimitedLLMExtractionStrategy(LLMExtractionStrategy):
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args,
+                 boilerplate_filter: BoilerplateFilter | None = None,
+                 combo: tuple | None = None,
+                 boilerplate_terms: list[str] | None = None,
+                 structured_output: bool = True,
+                 response_model: type[BaseModel] | None = None,
+                 **kwargs):
         super().__init__(*args, **kwargs)
-        max_chunks = 5
+        max_chunks = MAX_CHUNKS
 
         self.max_chunks = max_chunks
+        # Wenn gesetzt, werden wiederkehrende Blöcke der Domain entfernt und Chunks,
+        # die für `combo` schon bewertet wurden, übersprungen.
+        self.boilerplate_filter = boilerplate_filter
+        # None: keine Boilerplate entfernen, sonst Begriffe, deren Blöcke erhalten bleiben
+        self.boilerplate_terms = boilerplate_terms
+        self.combo = combo
+        # Use the provider's JSON schema mode (response_format json_schema) if it has one
+        self.structured_output = structured_output
+        # Model the schema was built from; answers are validated against it (see _is_valid)
+        self.response_model = response_model
 
         # self.chunk_warning_threshold = chunk_warning_threshold
         # self.chunk_count = 0
         # self.warnings_issued = []
 
-    def _merge(self, documents, chunk_token_threshold, overlap) -> list[str]:
-        """Override merge method to implement hard chunk limiting"""
-        merged = super()._merge(documents, chunk_token_threshold, overlap)
+    def extract(self, url, ix, html):
+        """Ask the model about one chunk.  An answer that does not match the schema is
+        retried once for this chunk.  If the retry fails too, or the API call fails, an
+        error block is returned: the page then fails (and is not cached), so the combo
+        is retried on the next run instead of being recorded as negative."""
+        for attempt in range(2):
+            try:
+                content = self.complete(url, html)
+            except Exception as e:
+                log.warning(f"LLM call failed for block {ix} of {url}: {e}")
+                return [{"index": ix, "error": True, "tags": ["error"], "content": str(e)}]
+
+            blocks = self.parse_response(content, ix)
+            if self._is_valid(blocks):
+                return blocks
+            log.warning(f"Invalid answer for block {ix} of {url} (attempt {attempt + 1}): "
+                        f"{str(content)[:200]}")
+
+        return [{"index": ix, "error": True, "tags": ["error"],
+                 "content": f"No valid answer from {self.llm_config.provider}: {str(content)[:200]}"}]
+
+    def _is_valid(self, blocks) -> bool:
+        """Whether every block is a verdict matching the schema, including the field
+        types (e.g. a boolean `result`, not "ja")"""
+        if not blocks or any(block.get("error") for block in blocks):
+            return False
+        if self.response_model is None:
+            required = self.schema.get("required", [])
+            return all(all(key in block for key in required) for block in blocks)
+
+        # Only the schema's fields: parse_response adds "error" and "model"
+        fields = self.schema.get("properties", {})
+        try:
+            for block in blocks:
+                self.response_model.model_validate({key: value for key, value in block.items()
+                                                    if key in fields})
+        except ValidationError:
+            return False
+        return True
+
+    def use_structured_output(self) -> bool:
+        return self.structured_output and self.llm_config.provider not in _no_structured_output
+
+    def response_format(self) -> dict:
+        """response_format asking for a single object matching the schema"""
+        return {
+            "type": "json_schema",
+            "json_schema": {
+                "name": self.schema.get("title", "result"),
+                "schema": self.schema,
+                "strict": True,
+            },
+        }
+
+    def complete(self, url, html) -> str:
+        """Send one chunk to the model and return its answer.  Falls back to crawl4ai's
+        prompt without response_format if the provider rejects structured output; other
+        errors are raised and end up as an error block (see extract)."""
+        from litellm.exceptions import BadRequestError
+
+        provider = self.llm_config.provider
+        if self.use_structured_output():
+            try:
+                return self._completion(self.build_structured_prompt(url, html),
+                                        {**self.extra_args, "response_format": self.response_format()})
+            except BadRequestError as e:
+                if not _rejects_structured_output(e):
+                    raise
+                log.warning(f"{provider} rejected structured output, using plain prompt: {e}")
+                content = self._completion(self.build_prompt(url, html), self.extra_args)
+                _no_structured_output.add(provider)
+                return content
+        return self._completion(self.build_prompt(url, html), self.extra_args)
+
+    def _completion(self, prompt, extra_args) -> str:
+        with global_limit("llm"):
+            response = perform_completion_with_backoff(
+                self.llm_config.provider,
+                prompt,
+                self.llm_config.api_token,
+                base_url=self.llm_config.base_url,
+                extra_args=extra_args,
+            )
+        if isinstance(response, list):
+            # perform_completion_with_backoff gives up on rate limits with an error block
+            raise RuntimeError(response[0]["content"])
+
+        # Track usage like LLMExtractionStrategy.extract
+        usage = TokenUsage(
+            completion_tokens=response.usage.completion_tokens,
+            prompt_tokens=response.usage.prompt_tokens,
+            total_tokens=response.usage.total_tokens,
+        )
+        self.usages.append(usage)
+        self.total_usage.completion_tokens += usage.completion_tokens
+        self.total_usage.prompt_tokens += usage.prompt_tokens
+        self.total_usage.total_tokens += usage.total_tokens
+
+        return response.choices[0].message.content
+
+    def run_chunks(self, url, chunks) -> list[dict]:
+        """Like run(), but for chunks that were already merged elsewhere (in the process
+        pool, see tasks.scraper.prepare_chunks) and passed through
+        strip_boilerplate/limit_chunks"""
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            results = executor.map(
+                lambda ix: self.extract(url, ix, sanitize_input_encode(chunks[ix])),
+                range(len(chunks)))
+            return [block for blocks in results for block in blocks]
+
+    def build_prompt(self, url, html) -> str:
+        """Build the prompt for one chunk the same way LLMExtractionStrategy.extract does
+        for schema extraction"""
+        return self._fill_prompt(PROMPT_EXTRACT_SCHEMA_WITH_INSTRUCTION, url, html)
+
+    def build_structured_prompt(self, url, html) -> str:
+        """Build the prompt for one chunk when the schema is given via response_format"""
+        return self._fill_prompt(PROMPT_EXTRACT_STRUCTURED, url, html)
+
+    def _fill_prompt(self, prompt, url, html) -> str:
+        variable_values = {
+            "URL": url,
+            "HTML": escape_json_string(sanitize_html(html)),
+            "REQUEST": self.instruction,
+            "SCHEMA": json.dumps(self.schema, indent=2),
+        }
+        for variable, value in variable_values.items():
+            prompt = prompt.replace("{" + variable + "}", value)
+        return prompt
+
+    def parse_response(self, content, ix=0) -> list[dict]:
+        """Parse the model's answer for one chunk into blocks"""
+        try:
+            blocks = repair_json(content)
+        except ValueError:
+            return [{"index": ix, "error": True, "tags": ["error"], "content": str(content)}]
+        for block in blocks:
+            block["error"] = False
+            block["model"] = self.llm_config.provider
+        return blocks
+
+    def batch_request(self, custom_id, url, chunk) -> dict:
+        """One line of an OpenAI batch input file asking the model about `chunk`"""
+        provider = self.llm_config.provider
+        # litellm-Präfix ("openai/...") entfernen
+        model = provider.split("/", 1)[1] if "/" in provider else provider
+        body = {"model": model, **self.extra_args}
+        if self.use_structured_output():
+            body["messages"] = [{"role": "user", "content": self.build_structured_prompt(url, chunk)}]
+            body["response_format"] = self.response_format()
+        else:
+            body["messages"] = [{"role": "user", "content": self.build_prompt(url, chunk)}]
+        return {
+            "custom_id": custom_id,
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": body,
+        }
+
+    def strip_boilerplate(self, url, documents) -> list[str]:
+        """Remove blocks that are boilerplate on the domain of `url`"""
+        if not self.boilerplate_filter or self.boilerplate_terms is None:
+            return documents
+        stripped = self.boilerplate_filter.strip(url, documents, self.boilerplate_terms)
+        log.info(f"Boilerplate filter kept {len(stripped)} of {len(documents)} blocks")
+        return stripped
+
+    def limit_chunks(self, merged) -> list[str]:
+        """Apply the hard chunk limit, then drop chunks already seen for this combo.  Only
+        the chunks that are actually sent are marked as seen: a chunk cut off here may
+        still be evaluated when it appears on another URL."""
         chunk_count = len(merged)
         if chunk_count > self.max_chunks:
             log.warning(f"Content would generate {chunk_count} chunks, limiting to {self.max_chunks}")
             # Implement truncation or alternative processing
             merged = merged[:self.max_chunks]
             # self.warnings_issued.append(f"Content truncated to {self.max_chunks} chunks")
-        return merged
\ No newline at end of file
+
+        if self.boilerplate_filter and self.combo:
+            unique = self.boilerplate_filter.dedupe_chunks(self.combo, merged)
+            if len(unique) < len(merged):
+                log.info(f"Skipping {len(merged) - len(unique)} chunks already seen for {self.combo}")
+            merged = unique
+        return merged
+
+
+class CascadeLLMExtractionStrategy(ChunkLimitedLLMExtractionStrategy):
+    """Screens every chunk with a cheap model and re-asks `escalation_strategy` (the
+    expensive model) only for chunks that the cheap model considers positive, or where
+    its `confidence` is below `min_confidence`.  Negative verdicts of the cheap model
+    are final."""
+
+    def __init__(self, *args,
+                 escalation_strategy: ChunkLimitedLLMExtractionStrategy,
+                 min_confidence: float = 0.8,
+                 **kwargs):
+        super().__init__(*args, **kwargs)
+        self.escalation_strategy = escalation_strategy
+        self.min_confidence = min_confidence
+
+    def _needs_escalation(self, blocks) -> bool:
+        if not blocks:
+            return True
+        for block in blocks:
+            if block.get("error") or block.get("result"):
+                return True
+            if float(block.get("confidence") or 0.0) < self.min_confidence:
+                return True
+        return False
+
+    def extract(self, url, ix, html):
+        blocks = super().extract(url, ix, html)
+        if not self._needs_escalation(blocks):
+            return blocks
+
+        log.info(f"Escalating block {ix} of {url} to {self.escalation_strategy.llm_config.provider}")
+        return self.escalation_strategy.extract(url, ix, html)
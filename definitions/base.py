@@ -1,23 +1,42 @@
+import itertools
+import re
 
-from typing import Callable
 
 class BaseDefinition:
-    # input_file: str
+    input_file: str
     output_file: str
     combo_keys: tuple
     query_template: str
     prompt_template: str
+    # Werte für alle Schlüssel in `combo_keys` außer "einrichtung",
+    # z.B. {"software": ["Moodle", "Ilias", "OpenOLAT"]}
+    options: dict[str, list[str]] = {}
+    # Wiederkehrende Blöcke (Navigation, Footer) vor dem LLM entfernen, siehe boilerplate.py.
+    # Aus, wenn der gesuchte Hinweis typischerweise im Menü steht (z.B. ein Link zum LMS).
+    strip_boilerplate: bool = False
 
     @classmethod
-    def load_institutions(cls):
-        """ Läd die liste der Institutionen. """
-        raise NotImplementedError("Diese Methode muss überschrieben werden.")
+    def load_institutions(cls, log=None):
+        """ Läd die liste der Institutionen aus `input_file`. """
+        from read_universities import read_universities
+        return read_universities(cls.input_file, log=log)
 
-    @staticmethod
-    def make_combos(einrichtungen: list[str]) -> set[tuple]:
+    @classmethod
+    def boilerplate_terms(cls, arguments: dict[str, str]) -> list[str] | None:
+        """ Begriffe, deren Blöcke beim Entfernen der Boilerplate erhalten bleiben: die
+            Werte der Kombination außer der Einrichtung und die festen Wörter der
+            Suchanfrage.  None, wenn die Definition keine Boilerplate entfernt. """
+        if not cls.strip_boilerplate:
+            return None
+        terms = [value for key, value in arguments.items() if key != "einrichtung"]
+        fixed_words = re.sub(r"\{[^}]*\}", " ", cls.query_template).split()
+        terms += [word for word in fixed_words if len(word) > 2 and ":" not in word]
+        return terms
+
+    @classmethod
+    def make_combos(cls, einrichtungen: list[str]) -> set[tuple]:
         """
-        Diese Methode soll überschrieben werden. Die Methode
-        nimmt die Liste der Einrichtungen, und macht daraus
+        Nimmt die Liste der Einrichtungen, und macht daraus
         zu untersuchende Tuple, z.B.:
         [
             ('Uni Göttingen', 'Moodle'),
@@ -25,8 +44,12 @@ class BaseDefinition:
             ('Uni Göttingen', 'OpenOLAT')
         ]
 
-        Die Basisversion fügt keine Kombinationen dazu,
-        sondern gibt nur die Einrichtungen selbst zurück.
+        Die Werte für alle weiteren Schlüssel in `combo_keys` kommen aus
+        `options`.  Ohne weitere Schlüssel werden nur die Einrichtungen
+        selbst zurückgegeben.
         """
-        combos = {(e,) for e in einrichtungen}
-        return combos
\ No newline at end of file
+        option_lists = [cls.options[key] for key in cls.combo_keys[1:]]
+        combos = {(e, *rest)
+                  for e in einrichtungen
+                  for rest in itertools.product(*option_lists)}
+        return combos
@@ -0,0 +1,49 @@
+""" Findet Crawler-Definitionen anhand ihrer TOML-Dateien in diesem Verzeichnis.
+
+Das Modul importiert bewusst nur die Standardbibliothek, damit `baseline.py list` und
+ähnliche Befehle schnell starten. """
+import tomllib
+from pathlib import Path
+from typing import Type
+
+from definitions.base import BaseDefinition
+
+DEFINITIONS_DIR = Path(__file__).parent
+
+REQUIRED_KEYS = ("input_file", "output_file", "combo_keys", "query_template", "prompt_template")
+
+
+def list_definitions() -> list[str]:
+    """ Listet die Namen aller verfügbaren Crawler-Definitionen auf. """
+    return sorted(path.stem for path in DEFINITIONS_DIR.glob("*.toml"))
+
+
+def load_definition(name: str) -> Type[BaseDefinition]:
+    """ Läd eine Crawler-Definition nach dem Namen der TOML-Datei.  Es wird eine Klasse
+        als Typ zurückgegeben.  Wenn keine gültige Definition gefunden wird, wird ein
+        ValueError ausgelöst. """
+    path = DEFINITIONS_DIR / f"{name}.toml"
+    if not path.exists():
+        raise ValueError(f"No definition found for {name}")
+
+    with open(path, "rb") as f:
+        data = tomllib.load(f)
+
+    missing = [key for key in REQUIRED_KEYS if key not in data]
+    if missing:
+        raise ValueError(f"Definition {name} is missing keys: {', '.join(missing)}")
+
+    data["combo_keys"] = tuple(data["combo_keys"])
+    if data["combo_keys"][0] != "einrichtung":
+        raise ValueError(f"Definition {name}: first combo key must be 'einrichtung'")
+
+    options = data.setdefault("options", {})
+    for key in data["combo_keys"][1:]:
+        if key not in options:
+            raise ValueError(f"Definition {name}: no options given for combo key '{key}'")
+
+    if not isinstance(data.get("strip_boilerplate", False), bool):
+        raise ValueError(f"Definition {name}: strip_boilerplate must be true or false")
+
+    class_name = data.pop("class_name", name)
+    return type(class_name, (BaseDefinition,), data)
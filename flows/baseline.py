@@ -0,0 +1,393 @@
+""" Der Prefect-Flow für einen Crawler-Lauf.
+
+Dieses Modul zieht die schweren Abhängigkeiten (Prefect, crawl4ai, Google API) nach sich
+und wird daher von `baseline.py` erst importiert, wenn ein Lauf tatsächlich startet. """
+import asyncio
+import json
+import textwrap
+from dataclasses import dataclass, field
+from functools import partial
+from typing import AsyncIterable, Awaitable, Callable, Iterable, Iterator, Type
+
+import dotenv
+from googleapiclient.discovery import build
+from prefect import flow, task
+from prefect.artifacts import create_markdown_artifact
+from prefect.cache_policies import INPUTS, TASK_SOURCE
+from prefect.logging import get_run_logger
+from prefect.runtime import task_run
+
+from definitions.base import BaseDefinition
+from definitions.registry import load_definition
+from tasks.scraper import (UrlResult, boilerplate_filter, close_fetchers,
+                           configure_llm_executor, extract_page, fetch_page)
+from politeness import interleave
+from store import ResultStore
+from utils import (DEFAULT_EVALUATE_WORKERS, DEFAULT_EXTRACT_WORKERS,
+                   DEFAULT_FETCH_WORKERS, DEFAULT_SEARCH_WORKERS, FETCH_AHEAD,
+                   MAX_URLS, global_limit, read_done_combos)
+
+
+@task
+def get_done_combos(output_file: str, keys: tuple) -> set[tuple]:
+    return read_done_combos(output_file, keys)
+
+
+@task
+def load_institutions(modulename: str) -> list:
+    """ Läd die Liste der Institutionen einer Crawler-Definition. """
+    return load_definition(modulename).load_institutions(log=get_run_logger())
+
+
+@task(cache_policy=TASK_SOURCE+INPUTS, log_prints=True, tags=['google-search'])
+def google_search(query: str) -> list[str]:
+    """ Führt eine Google-Suche aus und gibt eine Liste von URLs zurück. """
+
+    log = get_run_logger()
+    log.info("Searching for %s...", query)
+    api_key = dotenv.get_key(".env", "GOOGLE_API_KEY")
+    cse_id = dotenv.get_key(".env", "GOOGLE_CSE_ID")
+    if not api_key or not cse_id:
+        log.error("Missing GOOGLE_API_KEY or GOOGLE_CSE_ID in .env file")
+        return []
+    service = build("customsearch", "v1", developerKey=api_key)
+    with global_limit("search"):
+        res = service.cse().list(q=query, cx=cse_id, num=10).execute()  # pylint: disable=E1101
+
+    if len(res.get('items', [])) == 0:
+        log.warning("No results found for query: %s", query)
+        log.warning("response: %s", res)
+
+    return [item.get('link', '') for item in res.get('items', []) if 'link' in item]
+
+
+@dataclass
+class ComboJob:
+    """ Eine Kombination auf ihrem Weg durch die Pipeline. """
+    index: int
+    arguments: dict[str, str]
+    query: str
+    urls: list[str] = field(default_factory=list)
+    pages: list[str] = field(default_factory=list)
+    # Nur im Batch-Modus: die Chunks jeder Seite
+    chunks: list[list[str]] = field(default_factory=list)
+    results: list[UrlResult] = field(default_factory=list)
+    res_item: dict | None = None
+
+
+Stage = tuple[str, int, Callable[[ComboJob], Awaitable[None]]]
+
+
+async def run_pipeline(jobs: Iterable[ComboJob] | AsyncIterable[ComboJob], stages: list[Stage],
+                       queue_size: int) -> list[ComboJob]:
+    """ Lässt `jobs` durch die Stufen laufen.  Jede Stufe ist ein Tupel aus Name, Anzahl
+        Worker und Handler; zwischen den Stufen liegen Queues mit höchstens `queue_size`
+        Jobs.  Ein Job wird erzeugt, sobald der vorige in die erste Queue gelegt wurde, und
+        wartet dann auf Platz; es gibt also höchstens `queue_size` + 1 erzeugte Jobs, die
+        noch nicht in einer Stufe sind.
+
+        Schlägt ein Job fehl, wird er geloggt und verworfen; er landet dann nicht in der
+        Ausgabedatei und wird beim nächsten Lauf wiederholt.  Gibt die fehlgeschlagenen
+        Jobs zurück. """
+    log = get_run_logger()
+    failed: list[ComboJob] = []
+    queues: list[asyncio.Queue[ComboJob]] = [asyncio.Queue(maxsize=queue_size) for _ in stages]
+
+    async def worker(name, handler, inbox, outbox):
+        while True:
+            job = await inbox.get()
+            try:
+                await handler(job)
+                if outbox is not None:
+                    await outbox.put(job)
+            except Exception:
+                log.exception("Stage %s failed for %s", name, job.arguments)
+                failed.append(job)
+            finally:
+                inbox.task_done()
+
+    workers = []
+    for i, (name, count, handler) in enumerate(stages):
+        inbox = queues[i]
+        outbox = queues[i + 1] if i + 1 < len(queues) else None
+        workers += [asyncio.create_task(worker(name, handler, inbox, outbox), name=f"{name}-{n}")
+                    for n in range(count)]
+
+    if isinstance(jobs, AsyncIterable):
+        async for job in jobs:
+            await queues[0].put(job)
+    else:
+        for job in jobs:
+            await queues[0].put(job)
+
+    # Die Stufen nacheinander leerlaufen lassen, dann die Worker beenden
+    for queue in queues:
+        await queue.join()
+    for w in workers:
+        w.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+    return failed
+
+
+async def search_job(job: ComboJob, store: ResultStore):
+    # google_search ist synchron und blockiert
+    urls = await asyncio.to_thread(google_search, job.query)
+    await asyncio.to_thread(store.record_search, job.query, urls)
+    job.urls = urls[:MAX_URLS]
+
+
+async def fetch_url(url: str, store: ResultStore) -> str:
+    page = await fetch_page(url)
+    await asyncio.to_thread(store.record_page, url, page)
+    return page
+
+
+async def fetch_job(job: ComboJob, store: ResultStore, count: int | None = None):
+    # Die ersten `count` URLs (alle, wenn None) gleichzeitig anfragen; wie viele davon
+    # wirklich laufen, entscheidet der Scheduler pro Host (siehe politeness.py)
+    job.pages = list(await asyncio.gather(*(fetch_url(url, store) for url in job.urls[:count])))
+
+
+def load_todo(modulename: str) -> tuple[Type[BaseDefinition], dict, set[tuple]] | None:
+    """ Läd eine Crawler-Definition, ihre Institutionen und die noch offenen Kombinationen.
+        Gibt None zurück, wenn die Liste der Institutionen fehlt. """
+    log = get_run_logger()
+
+    mod = load_definition(modulename)
+    try:
+        unis = load_institutions(modulename)
+        unis_dict = {uni["name"]: uni for uni in unis}
+    except FileNotFoundError as e:
+        log.error(e)
+        return None
+
+    # Filter: only universities with "Humboldt" in name
+    # unis = [uni for uni in unis if "Humboldt" in uni["name"]]
+
+    uni_names = [uni['name'] for uni in unis]
+    all_combos = mod.make_combos(uni_names)
+
+    combos_done = get_done_combos(mod.output_file, keys=mod.combo_keys)
+    combos_todo = all_combos - combos_done
+
+    print(f"Total of {len(all_combos)} inputs")
+    print(f"Already done: {len(combos_done)}")
+    print(f"Remaining: {len(combos_todo)}")
+
+    # # Limit to 10 combos
+    # combos_todo = list(combos_todo)[:10]
+
+    return mod, unis_dict, combos_todo
+
+
+def make_job(mod: Type[BaseDefinition], unis_dict: dict, index: int, combo: tuple) -> ComboJob:
+    """ Erzeugt den Job für eine Kombination. """
+    arguments = dict(zip(mod.combo_keys, combo))
+    einrichtung = arguments["einrichtung"]
+    item = unis_dict[einrichtung]
+
+    values: dict = arguments.copy()
+    values.update(item)
+
+    query = mod.query_template.format(**values)
+    return ComboJob(index=index, arguments=arguments, query=query)
+
+
+def make_jobs(mod: Type[BaseDefinition], unis_dict: dict, combos_todo: set[tuple]) -> Iterator[ComboJob]:
+    """ Erzeugt die Jobs für die offenen Kombinationen nach und nach, abwechselnd für
+        verschiedene Einrichtungen. """
+    for i, combo in enumerate(interleave(combos_todo)):
+        yield make_job(mod, unis_dict, i, combo)
+
+
+def append_result(output_file: str, res_item: dict):
+    with open(output_file, "a", encoding='utf-8') as f:
+        f.write(json.dumps(res_item, ensure_ascii=False) + "\n")
+
+
+def forget_combo(job: ComboJob):
+    """ Gibt den Speicher frei, den der Boilerplate-Filter für die Kombination belegt. """
+    boilerplate_filter.forget_combo(tuple(job.arguments.values()))
+
+
+def make_stages(mod: Type[BaseDefinition], store: ResultStore,
+                search_workers: int, fetch_workers: int,
+                extract_workers: int, evaluate_workers: int) -> list[Stage]:
+    """ Die Stufen Suche → Laden → Extraktion → Bewertung.  Danach steht in `res_item`
+        jedes Jobs die Zeile für die Ausgabedatei. """
+    prompt_template = mod.prompt_template
+    # Jeder Extraktions-Worker hält während seiner LLM-Aufrufe einen Thread
+    configure_llm_executor(extract_workers)
+
+    async def extract(job: ComboJob):
+        # Die Stufe "fetch" hat die ersten Seiten geladen.  Weitere Seiten werden erst
+        # geladen, wenn die Seite davor bewertet wird, höchstens FETCH_AHEAD im Voraus.
+        fetches: dict[int, asyncio.Task[str]] = {}
+        try:
+            for i, url in enumerate(job.urls):
+                for j in range(len(job.pages), min(i + 1 + FETCH_AHEAD, len(job.urls))):
+                    if j not in fetches:
+                        fetches[j] = asyncio.create_task(fetch_url(job.urls[j], store))
+                page = job.pages[i] if i < len(job.pages) else await fetches[i]
+
+                result = await extract_page(url=url,
+                                            markdown=page,
+                                            prompt_template=prompt_template,
+                                            arguments=job.arguments,
+                                            boilerplate_terms=mod.boilerplate_terms(job.arguments))
+                await asyncio.to_thread(store.record_verdict, url,
+                                        prompt_template.format(**job.arguments),
+                                        result.result, result.model)
+                job.results.append(result)
+                if result.result:
+                    # exit early
+                    break
+        finally:
+            # Vorab angefragte Seiten, die nicht mehr gebraucht werden, fertig laden
+            # lassen; sie landen im Cache
+            await asyncio.gather(*fetches.values(), return_exceptions=True)
+
+    async def evaluate(job: ComboJob):
+        job.res_item = await evaluate_combo(job.query, prompt_template=prompt_template,
+                                            arguments=job.arguments, urls=job.urls,
+                                            results=job.results)
+
+    return [
+        ("search", search_workers, partial(search_job, store=store)),
+        ("fetch", fetch_workers, partial(fetch_job, store=store, count=1 + FETCH_AHEAD)),
+        ("extract", extract_workers, extract),
+        ("evaluate", evaluate_workers, evaluate),
+    ]
+
+
+@flow(log_prints=True)
+async def baseline(modulename: str,
+                   search_workers: int = DEFAULT_SEARCH_WORKERS,
+                   fetch_workers: int = DEFAULT_FETCH_WORKERS,
+                   extract_workers: int = DEFAULT_EXTRACT_WORKERS,
+                   evaluate_workers: int = DEFAULT_EVALUATE_WORKERS,
+                   queue_size: int = 16) -> None:
+    """ Bearbeitet alle offenen Kombinationen einer Crawler-Definition.
+
+    Die Kombinationen laufen durch eine Pipeline aus Stufen (Planen → Suche → Laden →
+    Extraktion → Bewertung → Schreiben), die über beschränkte Queues verbunden sind.  Jede
+    Stufe hat ihre eigene Anzahl Worker; volle Queues bremsen die vorherigen Stufen, so
+    bleibt der Speicherverbrauch konstant, und der Browser lädt weiter Seiten, während
+    LLM-Aufrufe laufen. """
+    log = get_run_logger()
+
+    todo = load_todo(modulename)
+    if todo is None:
+        return
+    mod, unis_dict, combos_todo = todo
+    output_file = mod.output_file
+    prompt_template = mod.prompt_template
+
+    # Hält fest, was schon gesucht, geladen und bewertet wurde (für `baseline.py plan`)
+    store = ResultStore()
+    written = 0
+
+    async def write(job: ComboJob):
+        # Nur ein Worker schreibt, daher keine überlappenden Zeilen.  Die Jobs kommen nicht
+        # in der Reihenfolge von `job.index` an, daher wird hier mitgezählt
+        nonlocal written
+        append_result(output_file, job.res_item)
+        forget_combo(job)
+        written += 1
+        print(f"Done {written}/{len(combos_todo)}: {job.arguments}")
+
+    try:
+        stages = make_stages(mod, store, search_workers, fetch_workers,
+                             extract_workers, evaluate_workers)
+        failed = await run_pipeline(make_jobs(mod, unis_dict, combos_todo),
+                                    stages + [("write", 1, write)], queue_size=queue_size)
+    finally:
+        await close_fetchers()
+        store.close()
+    for job in failed:
+        forget_combo(job)
+    if failed:
+        log.warning("%d combos failed and will be retried on the next run", len(failed))
+
+
+def _evaluate_combo_task_name():
+    task_name = task_run.task_name
+    parameters = task_run.parameters
+    arguments = parameters.get("arguments", {})
+
+    new_name = task_name
+    for v in arguments.values():
+        new_name += '-' + str(v)
+    new_name = new_name.replace(" ", "-").lower()
+    return new_name
+
+
+@task(log_prints=True, task_run_name=_evaluate_combo_task_name, tags=['evaluate-combo'])
+async def evaluate_combo(query: str, prompt_template: str, arguments: dict[str, str],
+                         urls: list[str], results: list[UrlResult]) -> dict:
+    """ Fasst die Ergebnisse der einzelnen URLs einer Kombination zusammen, legt einen
+        Bericht als Artefakt an und gibt die Zeile für die Ausgabedatei zurück. """
+    combined_verdict = any(result.result for result in results)
+
+    # Create prefect artifact (markdown report)
+    prompt = prompt_template.format(**arguments)
+    args_markdown = "\n".join(f"    - {k}: {v}" for k, v in arguments.items())
+    markdown = textwrap.dedent(f"""\
+        # evaluate_combo results
+        - **Query:** {query}
+        - **Prompt:**
+        {textwrap.indent(prompt, "  ")}
+        - **Arguments:**
+        {args_markdown}
+        - **Result:** {combined_verdict}
+        - **Reasoning:**
+        
+        ## Inputs:
+        Analyzed the following URLs:
+        """)
+
+    for url, result in zip(urls, results):
+        markdown += textwrap.dedent(f"""\
+            - **URL:** {url}
+              **Result:** {result.result}
+              **Reasoning:** {result.reasoning}
+              **Model:** {result.model}
+            """)
+
+    description = f"Results for {arguments['einrichtung']}"
+
+    await create_markdown_artifact(
+        markdown=markdown,
+        key="evaluate-combo-results",
+        description=description
+    )  # type: ignore
+
+    return make_result_item(arguments, urls, results)
+
+
+def make_result_item(arguments: dict[str, str], urls: list[str], results: list[UrlResult]) -> dict:
+    """ Baut die Zeile für die Ausgabedatei aus den Ergebnissen der einzelnen URLs. """
+    combined_verdict = any(result.result for result in results)
+
+    # Return result as JSON
+    combined_inputs = [
+        {"url": url, "result": result.result, "reasoning": result.reasoning,
+         "model": result.model}
+        for url, result in zip(urls, results)
+    ]
+
+    if not combined_verdict:
+        summary = "No evidence found"
+    else:
+        summary = "Evidence found"
+
+    res_item: dict = {
+        "result": combined_verdict,
+    }
+    res_item.update(arguments)
+    res_item['reasoning'] = {
+        'summary': summary,
+        'inputs': combined_inputs,
+    }
+
+    return res_item
@@ -0,0 +1,207 @@
+""" Batch-Modus: die Chunks werden nicht einzeln interaktiv an das LLM gegeben, sondern als
+Batch-Job (z.B. über die OpenAI-Batch-API, günstiger und mit höherem Durchsatz).
+
+Phase 1 (`batch_prepare`) sucht, lädt und chunkt alle offenen Kombinationen und schreibt für
+jeden Chunk eine Anfrage im Format der OpenAI-Batch-API in `batch_<name>.jsonl`.  Dazu
+kommt `batch_<name>_manifest.jsonl`, das jeder Kombination ihre URLs und Anfragen zuordnet.
+
+Phase 2 (`batch_ingest`) liest die Ausgabedatei des Batch-Jobs und schreibt die Ergebnisse
+genau wie der normale Lauf in die Ausgabedatei der Definition.  Die `custom_id` einer
+Anfrage hängt nur von Kombination, URL und Chunk ab (siehe `request_id`), so dass auch die
+Ausgabe eines älteren Batch-Jobs nach einem erneuten `batch_prepare` richtig zugeordnet
+wird; Anfragen, die im neuen Manifest fehlen, machen die Kombination unvollständig.
+
+`run_batch_stub` arbeitet eine Batch-Datei lokal ab, indem es jede Anfrage einzeln an
+`LLM_BASE_URL` schickt, und schreibt eine Ausgabedatei im Format der Batch-API.
+
+Ein vorgeschaltetes günstiges Modell (`LLM_SCREENING_PROVIDER`) wird im Batch-Modus nicht
+verwendet. """
+import hashlib
+import json
+from functools import partial
+
+import dotenv
+from prefect import flow
+from prefect.logging import get_run_logger
+from pydantic import ValidationError
+
+from definitions.registry import load_definition
+from flows.baseline import (ComboJob, append_result, fetch_job, forget_combo, load_todo,
+                            make_jobs, make_result_item, run_pipeline, search_job)
+from store import ResultStore
+from tasks.scraper import (UrlResult, close_fetchers, combine_blocks, make_llm_strategy,
+                           prepare_chunks)
+from utils import (DEFAULT_EXTRACT_WORKERS, DEFAULT_FETCH_WORKERS, DEFAULT_SEARCH_WORKERS,
+                   read_done_combos)
+
+
+def batch_files(modulename: str) -> tuple[str, str, str]:
+    """ Gibt die Namen der Eingabe-, Manifest- und Ausgabedatei eines Batch-Laufs zurück. """
+    return (f"batch_{modulename}.jsonl",
+            f"batch_{modulename}_manifest.jsonl",
+            f"batch_{modulename}_output.jsonl")
+
+
+def request_id(arguments: dict[str, str], url_index: int, url: str, chunk_index: int) -> str:
+    """ Gibt die `custom_id` der Anfrage für einen Chunk zurück.  Sie hängt nicht von der
+        Reihenfolge der offenen Kombinationen ab, die sich zwischen zwei Läufen ändert. """
+    key = json.dumps([list(arguments.values()), url_index, url, chunk_index], ensure_ascii=False)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+@flow(log_prints=True)
+async def batch_prepare(modulename: str,
+                        search_workers: int = DEFAULT_SEARCH_WORKERS,
+                        fetch_workers: int = DEFAULT_FETCH_WORKERS,
+                        chunk_workers: int = DEFAULT_EXTRACT_WORKERS,
+                        queue_size: int = 16) -> None:
+    """ Phase 1: sucht, lädt und chunkt alle offenen Kombinationen und schreibt die
+        Anfragen für den Batch-Job.  Vorhandene Batch-Dateien werden überschrieben. """
+    log = get_run_logger()
+
+    todo = load_todo(modulename)
+    if todo is None:
+        return
+    mod, unis_dict, combos_todo = todo
+    prompt_template = mod.prompt_template
+    batch_file, manifest_file, _ = batch_files(modulename)
+
+    store = ResultStore()
+    counts = {"combos": 0, "requests": 0}
+
+    async def chunk(job: ComboJob):
+        llm_strategy = make_llm_strategy(prompt_template, job.arguments, screening=False,
+                                         boilerplate_terms=mod.boilerplate_terms(job.arguments))
+        for url, page in zip(job.urls, job.pages):
+            job.chunks.append(await prepare_chunks(llm_strategy, url, page) if page else [])
+
+    with open(batch_file, "w", encoding="utf-8") as batch_f, \
+         open(manifest_file, "w", encoding="utf-8") as manifest_f:
+
+        async def write(job: ComboJob):
+            # Nur ein Worker schreibt, daher keine überlappenden Zeilen
+            llm_strategy = make_llm_strategy(prompt_template, job.arguments, screening=False)
+            requests: list[list[str]] = []
+            for url_index, (url, chunks) in enumerate(zip(job.urls, job.chunks)):
+                ids = []
+                for chunk_index, chunk_text in enumerate(chunks):
+                    custom_id = request_id(job.arguments, url_index, url, chunk_index)
+                    request = llm_strategy.batch_request(custom_id, url, chunk_text)
+                    batch_f.write(json.dumps(request, ensure_ascii=False) + "\n")
+                    ids.append(custom_id)
+                requests.append(ids)
+                counts["requests"] += len(ids)
+
+            entry = {"arguments": job.arguments, "query": job.query,
+                     "urls": job.urls, "requests": requests}
+            manifest_f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            counts["combos"] += 1
+            forget_combo(job)
+
+        try:
+            failed = await run_pipeline(make_jobs(mod, unis_dict, combos_todo), [
+                ("search", search_workers, partial(search_job, store=store)),
+                ("fetch", fetch_workers, partial(fetch_job, store=store)),
+                ("chunk", chunk_workers, chunk),
+                ("write", 1, write),
+            ], queue_size=queue_size)
+        finally:
+            await close_fetchers()
+            store.close()
+
+    print(f"Wrote {counts['requests']} requests for {counts['combos']} combos to {batch_file}")
+    for job in failed:
+        forget_combo(job)
+    if failed:
+        log.warning("%d combos failed and are not part of the batch", len(failed))
+
+
+def read_batch_output(batch_output_file: str) -> dict[str, str]:
+    """ Liest die Ausgabedatei eines Batch-Jobs und gibt die Antworten des Modells je
+        `custom_id` zurück.  Fehlgeschlagene Anfragen fehlen im Ergebnis. """
+    responses = {}
+    with open(batch_output_file, "r", encoding="utf-8") as f:
+        for line in f:
+            obj = json.loads(line)
+            response = obj.get("response") or {}
+            if obj.get("error") or response.get("status_code") != 200:
+                continue
+            responses[obj["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    return responses
+
+
+@flow(log_prints=True)
+def batch_ingest(modulename: str, batch_output_file: str | None = None) -> None:
+    """ Phase 2: wertet die Antworten des Batch-Jobs aus und schreibt für jede Kombination
+        eine Zeile in die Ausgabedatei, wie `evaluate_combo` es im normalen Lauf tut.
+        Kombinationen mit fehlenden oder fehlerhaften Antworten (auch solchen, die nicht
+        dem Schema entsprechen) werden übersprungen und zählen als unvollständig. """
+    log = get_run_logger()
+
+    mod = load_definition(modulename)
+    _, manifest_file, default_output_file = batch_files(modulename)
+    responses = read_batch_output(batch_output_file or default_output_file)
+    combos_done = read_done_combos(mod.output_file, mod.combo_keys)
+
+    store = ResultStore()
+    written = incomplete = 0
+    with open(manifest_file, "r", encoding="utf-8") as f:
+        for line in f:
+            entry = json.loads(line)
+            arguments = entry["arguments"]
+            if tuple(arguments[k] for k in mod.combo_keys) in combos_done:
+                continue
+
+            llm_strategy = make_llm_strategy(mod.prompt_template, arguments, screening=False)
+            prompt = mod.prompt_template.format(**arguments)
+            results: list[UrlResult] = []
+            try:
+                for url, ids in zip(entry["urls"], entry["requests"]):
+                    if not ids:
+                        result = UrlResult(reasoning="(No content extracted)", result=False)
+                    else:
+                        blocks = [block
+                                  for ix, custom_id in enumerate(ids)
+                                  for block in llm_strategy.parse_response(responses[custom_id], ix)]
+                        result = combine_blocks(blocks)
+                    store.record_verdict(url, prompt, result.result, result.model)
+                    results.append(result)
+                    if result.result:
+                        # exit early
+                        break
+            except (KeyError, RuntimeError, ValidationError) as e:
+                # KeyError: Antwort fehlt, RuntimeError: Fehlerblock, ValidationError:
+                # Antwort passt nicht zum Schema (z.B. ohne `result`)
+                log.warning("Skipping %s: incomplete or invalid batch output (%s)", arguments, e)
+                incomplete += 1
+                continue
+
+            append_result(mod.output_file, make_result_item(arguments, entry["urls"], results))
+            written += 1
+
+    store.close()
+    print(f"Wrote {written} results to {mod.output_file}, skipped {incomplete} incomplete combos")
+
+
+def run_batch_stub(batch_file: str, batch_output_file: str) -> None:
+    """ Arbeitet eine Batch-Datei lokal ab: jede Anfrage wird einzeln an `LLM_BASE_URL`
+        geschickt, die Antworten landen im Format der Batch-API in `batch_output_file`. """
+    from openai import OpenAI
+
+    client = OpenAI(api_key=dotenv.get_key(".env", "LLM_API_KEY"),
+                    base_url=dotenv.get_key(".env", "LLM_BASE_URL"))
+
+    with open(batch_file, "r", encoding="utf-8") as f_in, \
+         open(batch_output_file, "w", encoding="utf-8") as f_out:
+        for n, line in enumerate(f_in):
+            request = json.loads(line)
+            output: dict = {"id": f"batch_req_{n}", "custom_id": request["custom_id"]}
+            try:
+                completion = client.chat.completions.create(**request["body"])
+                output["response"] = {"status_code": 200, "body": completion.model_dump()}
+                output["error"] = None
+            except Exception as e:
+                output["response"] = None
+                output["error"] = {"code": type(e).__name__, "message": str(e)}
+            f_out.write(json.dumps(output, ensure_ascii=False) + "\n")
+            print(f"Processed {n + 1}: {request['custom_id']}")
@@ -0,0 +1,203 @@
+""" Mehrprozess-Modus (`baseline.py <name> --workers N`).
+
+Ein Prozess mit einer Event-Loop nutzt nur einen Kern.  Hier startet ein Koordinator N
+Worker-Prozesse, jeder mit eigener Event-Loop, eigenem Browser und eigener Pipeline
+(siehe flows/baseline.py).  Die Worker holen sich die Kombinationen aus der Tabelle
+`work_queue` im Ergebnisspeicher (store.py) und legen ihre Ergebnisse dort ab.
+
+Der Koordinator
+- füllt die Warteschlange mit den offenen Kombinationen,
+- setzt Grenzen, die für alle Worker zusammen gelten (`GLOBAL_SEARCH_LIMIT` für
+  Google-Suchen und `GLOBAL_LLM_LIMIT` für LLM-Aufrufe, Semaphoren in einem
+  multiprocessing.Manager, siehe utils.global_limit),
+- sammelt die Meldungen der Worker und schreibt als einziger Prozess die Ausgabedatei.
+
+Die Grenzen für Seitenabrufe (politeness.py) gelten für alle Worker zusammen: Die Plätze
+pro Host (`FETCH_PER_HOST`) teilen sie sich über Semaphoren im Manager, jeder bekommt ein
+N-tel von `FETCH_MAX_CONCURRENT` (mindestens 1) und wartet N-mal `FETCH_DELAY` zwischen
+zwei Abrufen desselben Hosts.  Zusammen belasten die Worker einen Host so nicht stärker
+als ein einzelner Prozess. """
+import asyncio
+import multiprocessing
+import queue
+import time
+from collections import Counter
+
+import dotenv
+from prefect import flow, tags
+from prefect.logging import get_run_logger
+
+from cpu_pool import configure_pool, cpu_workers
+from definitions.registry import load_definition
+from flows.baseline import (ComboJob, append_result, forget_combo, load_institutions,
+                            load_todo, make_job, make_stages, run_pipeline)
+from politeness import configure_scheduler, fetch_limits, interleave, make_host_slots
+from store import ResultStore
+from tasks.scraper import close_fetchers
+from utils import (DEFAULT_EVALUATE_WORKERS, DEFAULT_EXTRACT_WORKERS, DEFAULT_FETCH_WORKERS,
+                   DEFAULT_SEARCH_WORKERS, set_global_limits)
+
+
+# Queue des Koordinators für die Meldungen dieses Worker-Prozesses, gesetzt von run_worker
+_metrics = None
+
+
+@flow(log_prints=True)
+async def baseline_worker(modulename: str,
+                          worker_id: int,
+                          search_workers: int = DEFAULT_SEARCH_WORKERS,
+                          fetch_workers: int = DEFAULT_FETCH_WORKERS,
+                          extract_workers: int = DEFAULT_EXTRACT_WORKERS,
+                          evaluate_workers: int = DEFAULT_EVALUATE_WORKERS,
+                          queue_size: int = 4) -> None:
+    """ Bearbeitet Kombinationen aus der Warteschlange, bis sie leer ist.  Die Ergebnisse
+        landen im Ergebnisspeicher und als Meldung für den Koordinator. """
+    log = get_run_logger()
+
+    mod = load_definition(modulename)
+    unis_dict = {uni["name"]: uni for uni in load_institutions(modulename)}
+    worker = f"worker-{worker_id}"
+    store = ResultStore()
+
+    async def claim_jobs():
+        # run_pipeline holt die nächste Kombination, bevor es auf Platz in der ersten Queue
+        # wartet.  Ein Worker belegt so höchstens eine Kombination mehr, als in seine
+        # Pipeline passt; die übrigen bleiben für die anderen Worker
+        while True:
+            claimed = await asyncio.to_thread(store.claim_combo, modulename, worker)
+            if claimed is None:
+                return
+            seq, combo = claimed
+            yield make_job(mod, unis_dict, seq, combo)
+
+    async def finish(job: ComboJob):
+        await asyncio.to_thread(store.finish_combo, modulename, job.index, job.res_item)
+        forget_combo(job)
+        # Der Manager-Proxy blockiert ebenfalls, bis der Manager-Prozess geantwortet hat
+        await asyncio.to_thread(_metrics.put, {"event": "done", "worker": worker_id,
+                                               "seq": job.index, "arguments": job.arguments,
+                                               "result": job.res_item})
+
+    try:
+        stages = make_stages(mod, store, search_workers, fetch_workers,
+                             extract_workers, evaluate_workers)
+        failed = await run_pipeline(claim_jobs(), stages + [("finish", 1, finish)],
+                                    queue_size=queue_size)
+        for job in failed:
+            forget_combo(job)
+            store.fail_combo(modulename, job.index)
+            _metrics.put({"event": "failed", "worker": worker_id, "seq": job.index,
+                         "arguments": job.arguments})
+    finally:
+        await close_fetchers()
+        store.close()
+
+    if failed:
+        log.warning("%s: %d combos failed and will be retried on the next run", worker, len(failed))
+
+
+def run_worker(modulename: str, worker_id: int, workers: int, limits: dict, host_slots: list,
+               metrics, pool_size: int):
+    """ Einstiegspunkt eines Worker-Prozesses. """
+    global _metrics
+    _metrics = metrics
+    set_global_limits(limits)
+    configure_pool(pool_size)
+    configure_scheduler(workers, host_slots)
+    try:
+        with tags("baseline", f"worker-{worker_id}"):
+            asyncio.run(baseline_worker(modulename, worker_id))
+    finally:
+        metrics.put({"event": "exit", "worker": worker_id})
+
+
+def _make_limits(manager) -> dict:
+    limits = {}
+    for name, key in (("search", "GLOBAL_SEARCH_LIMIT"), ("llm", "GLOBAL_LLM_LIMIT")):
+        value = dotenv.get_key(".env", key)
+        if value:
+            limits[name] = manager.BoundedSemaphore(int(value))
+    return limits
+
+
+@flow(log_prints=True)
+def baseline_coordinator(modulename: str, workers: int) -> None:
+    """ Verteilt die offenen Kombinationen auf `workers` Worker-Prozesse und schreibt ihre
+        Ergebnisse in die Ausgabedatei. """
+    log = get_run_logger()
+    store = ResultStore()
+    output_file = load_definition(modulename).output_file
+
+    # Was ein früherer Lauf fertig, aber nicht mehr geschrieben hat
+    for seq, res_item in store.unwritten_results(modulename):
+        append_result(output_file, res_item)
+        store.mark_written(modulename, seq)
+
+    todo = load_todo(modulename)
+    if todo is None:
+        store.close()
+        return
+    _, _, combos_todo = todo
+    store.enqueue_combos(modulename, interleave(combos_todo))
+
+    # Die Kerne für die CPU-lastigen Schritte unter den Workern aufteilen
+    pool_size = max(1, cpu_workers() // workers)
+    per_host, delay, _ = fetch_limits(workers)
+    log.info("All workers together fetch at most %d pages per host at a time; each worker "
+             "waits %.1f s between two fetches of the same host", per_host, delay)
+    context = multiprocessing.get_context("spawn")
+
+    with context.Manager() as manager:
+        limits = _make_limits(manager)
+        host_slots = make_host_slots(manager, per_host)
+        metrics = manager.Queue()
+        processes = [context.Process(target=run_worker, name=f"worker-{i}",
+                                     args=(modulename, i, workers, limits, host_slots, metrics,
+                                           pool_size))
+                     for i in range(workers)]
+        for process in processes:
+            process.start()
+
+        started = time.monotonic()
+        done: Counter = Counter()
+        failed: Counter = Counter()
+        running = workers
+        while running:
+            try:
+                message = metrics.get(timeout=5)
+            except queue.Empty:
+                # Ein Worker, der hart abgestürzt ist, meldet sich nicht mehr ab
+                if not any(process.is_alive() for process in processes):
+                    break
+                continue
+
+            worker_id = message["worker"]
+            if message["event"] == "done":
+                # Nur der Koordinator schreibt, daher keine überlappenden Zeilen
+                append_result(output_file, message["result"])
+                store.mark_written(modulename, message["seq"])
+                done[worker_id] += 1
+                total = sum(done.values())
+                rate = total / (time.monotonic() - started) * 60
+                print(f"Done {total}/{len(combos_todo)} (worker {worker_id}, "
+                      f"{rate:.1f} combos/min): {message['arguments']}")
+            elif message["event"] == "failed":
+                failed[worker_id] += 1
+            elif message["event"] == "exit":
+                running -= 1
+
+        for process in processes:
+            process.join()
+
+    for worker_id, process in enumerate(processes):
+        print(f"worker-{worker_id}: {done[worker_id]} done, {failed[worker_id]} failed")
+        if process.exitcode != 0:
+            log.error("worker-%d exited with code %s", worker_id, process.exitcode)
+        elif not done[worker_id] and not failed[worker_id]:
+            log.warning("worker-%d finished without processing a combo", worker_id)
+    counts = store.queue_counts(modulename)
+    store.close()
+    if counts.get("pending") or counts.get("claimed"):
+        log.warning("Unfinished combos left in the queue: %s", counts)
+    if sum(failed.values()):
+        log.warning("%d combos failed and will be retried on the next run", sum(failed.values()))
@@ -0,0 +1,46 @@
+""" Liest die JSON-Antworten eines LLMs, auch wenn sie nicht ganz sauber sind.
+
+Modelle ohne Structured Output (und gelegentlich auch solche mit) verpacken ihre Antwort in
+Code-Fences oder `<blocks>`-Tags, schreiben Text davor oder dahinter oder lassen Kommas vor
+schließenden Klammern stehen.  Das Modul importiert nur die Standardbibliothek. """
+import json
+import re
+
+
+def _longest_tag_content(tag: str, text: str) -> str:
+    """ Gibt den längsten Inhalt zwischen `<tag>` und `</tag>` zurück, oder "" (wie
+        `extract_xml_data` in crawl4ai). """
+    matches = re.findall(f"<{tag}>(.*?)</{tag}>", text, re.DOTALL)
+    return max(matches, key=len).strip() if matches else ""
+
+
+def repair_json(content) -> list[dict]:
+    """ Gibt die JSON-Objekte aus einer Antwort des Modells zurück.  Code-Fences,
+        `<blocks>`-Tags, Text um das JSON herum und Kommas vor schließenden Klammern
+        werden toleriert.  Löst ValueError aus, wenn nichts Brauchbares gefunden wird. """
+    text = (content or "").strip()
+    fence = re.search(r"```(?:json)?\s*(.*?)```", text, re.DOTALL)
+    if fence:
+        text = fence.group(1).strip()
+    text = _longest_tag_content("blocks", text) or text
+
+    candidates = [text]
+    for start_char, end_char in ("[]", "{}"):
+        start, end = text.find(start_char), text.rfind(end_char)
+        if start != -1 and end > start:
+            candidates.append(text[start:end + 1])
+
+    for candidate in candidates:
+        for attempt in (candidate, re.sub(r",\s*([}\]])", r"\1", candidate)):
+            try:
+                data = json.loads(attempt)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(data, dict) and len(data) == 1 and isinstance(next(iter(data.values())), list):
+                # {"results": [...]}
+                data = next(iter(data.values()))
+            if isinstance(data, dict):
+                return [data]
+            if isinstance(data, list) and data and all(isinstance(block, dict) for block in data):
+                return data
+    raise ValueError(f"No JSON object found in: {text[:200]}")
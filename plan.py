@@ -0,0 +1,204 @@
+""" Schätzt vor einem Lauf, wie viele Suchanfragen, Seiten, LLM-Tokens und Kosten anfallen.
+
+Grundlage sind die noch offenen Kombinationen und der Ergebnisspeicher (`store.py`): Was
+dort schon steht, liegt auch im Cache der Prefect-Tasks und kostet nichts mehr.  Für
+Suchanfragen und Seiten, die noch nicht im Speicher sind, wird mit Durchschnittswerten
+gerechnet.  Seiten und Tokens sind eine obere Schranke, da der Lauf nach dem ersten
+positiven Ergebnis einer Kombination keine weiteren Seiten lädt und bewertet.
+
+Preise pro Million Tokens können in der .env-Datei als `LLM_PRICE_INPUT` und
+`LLM_PRICE_OUTPUT` angegeben werden.  Für die Dauer gelten dieselben Grenzen wie im Lauf:
+`FETCH_PER_HOST`, `FETCH_DELAY` und `FETCH_MAX_CONCURRENT` (siehe politeness.py) und im
+Mehrprozess-Modus `GLOBAL_SEARCH_LIMIT` und `GLOBAL_LLM_LIMIT`. """
+import math
+from dataclasses import dataclass
+
+import dotenv
+
+from definitions.registry import load_definition
+from politeness import fetch_limits
+from store import ResultStore
+from utils import (CHUNK_OVERLAP_RATE, CHUNK_TOKEN_THRESHOLD, DEFAULT_EXTRACT_WORKERS,
+                   DEFAULT_FETCH_WORKERS, DEFAULT_SEARCH_WORKERS, MAX_CHUNKS, MAX_URLS,
+                   WORD_TOKEN_RATE, read_done_combos)
+
+# Annahmen für die Schätzung
+SECONDS_PER_SEARCH = 1.0
+SECONDS_PER_FETCH = 5.0
+SECONDS_PER_LLM_CALL = 8.0
+# Parallele LLM-Aufrufe je Seite (siehe ChunkLimitedLLMExtractionStrategy.run_chunks)
+LLM_CALLS_PER_WORKER = 4
+# Rahmen des Prompts und JSON-Schema (als Structured Output), die zu jedem Chunk dazukommen
+PROMPT_OVERHEAD_TOKENS = 200
+COMPLETION_TOKENS_PER_CALL = 150
+# Wenn noch keine Seite im Speicher ist
+DEFAULT_PAGE_WORDS = 2000
+
+
+@dataclass
+class Plan:
+    modulename: str
+    combos_total: int = 0
+    combos_done: int = 0
+    combos_todo: int = 0
+    searches_cached: int = 0
+    searches_needed: int = 0
+    pages_cached: int = 0
+    pages_needed: int = 0
+    verdicts_cached: int = 0
+    pages_to_evaluate: int = 0
+    llm_calls: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def cost(self, price_input: float, price_output: float) -> float:
+        return (self.prompt_tokens * price_input + self.completion_tokens * price_output) / 1e6
+
+    def wall_time(self, search_workers: int, fetch_workers: int, extract_workers: int,
+                  workers: int = 1) -> dict[str, float]:
+        """ Geschätzte Dauer jeder Stufe in Sekunden für `workers` Prozesse mit je so vielen
+            Workern pro Stufe.  Da die Stufen parallel laufen, bestimmt die langsamste die
+            Dauer des Laufs. """
+        searches = _capped(search_workers * workers, "GLOBAL_SEARCH_LIMIT", workers)
+        llm_calls = _capped(extract_workers * LLM_CALLS_PER_WORKER * workers,
+                            "GLOBAL_LLM_LIMIT", workers)
+        return {
+            "search": self.searches_needed * SECONDS_PER_SEARCH / searches,
+            "fetch": self.pages_needed / fetch_rate(fetch_workers, workers),
+            "extract": self.llm_calls * SECONDS_PER_LLM_CALL / llm_calls,
+        }
+
+
+def _capped(concurrency: int, key: str, workers: int) -> int:
+    """ Begrenzt `concurrency` auf die prozessübergreifende Grenze `key` aus der .env-Datei.
+        Diese gilt nur im Mehrprozess-Modus. """
+    limit = dotenv.get_key(".env", key)
+    if workers > 1 and limit:
+        return min(concurrency, int(limit))
+    return concurrency
+
+
+def fetch_rate(fetch_workers: int, workers: int = 1) -> float:
+    """ Geschätzte Seiten pro Sekunde.  Ein Fetch-Worker lädt die URLs einer Kombination
+        gleichzeitig, meist vom selben Host; wie viele davon wirklich parallel laufen,
+        begrenzt der Scheduler (`FETCH_PER_HOST`, `FETCH_DELAY`).  Insgesamt laufen höchstens
+        `FETCH_MAX_CONCURRENT` Abrufe gleichzeitig. """
+    per_host, delay, max_total = fetch_limits(workers)
+    seconds_per_combo = max(math.ceil(MAX_URLS / per_host) * SECONDS_PER_FETCH,
+                            (MAX_URLS - 1) * delay + SECONDS_PER_FETCH)
+    rate = fetch_workers * workers * MAX_URLS / seconds_per_combo
+    return min(rate, max_total * workers / SECONDS_PER_FETCH)
+
+
+def estimate_chunks(words: float) -> int:
+    """ Anzahl der Chunks, die eine Seite mit `words` Wörtern ergibt. """
+    tokens = words * WORD_TOKEN_RATE
+    return min(MAX_CHUNKS, math.ceil(tokens / CHUNK_TOKEN_THRESHOLD))
+
+
+def estimate_prompt_tokens(words: float, instruction_tokens: int) -> int:
+    """ Prompt-Tokens für alle Chunks einer Seite mit `words` Wörtern. """
+    chunks = estimate_chunks(words)
+    content = min(words * WORD_TOKEN_RATE * (1 + CHUNK_OVERLAP_RATE),
+                  chunks * CHUNK_TOKEN_THRESHOLD)
+    return int(content + chunks * (PROMPT_OVERHEAD_TOKENS + instruction_tokens))
+
+
+def make_plan(modulename: str, store: ResultStore) -> Plan:
+    """ Berechnet den Plan für die offenen Kombinationen einer Crawler-Definition. """
+    mod = load_definition(modulename)
+    unis = mod.load_institutions()
+    unis_dict = {uni["name"]: uni for uni in unis}
+
+    all_combos = mod.make_combos(list(unis_dict))
+    combos_done = read_done_combos(mod.output_file, mod.combo_keys)
+    combos_todo = all_combos - combos_done
+
+    plan = Plan(modulename=modulename,
+                combos_total=len(all_combos),
+                combos_done=len(combos_done),
+                combos_todo=len(combos_todo))
+    average_words = store.average_page_words() or DEFAULT_PAGE_WORDS
+
+    def add_page(words: float, prompt: str):
+        instruction_tokens = int(len(prompt.split()) * WORD_TOKEN_RATE)
+        chunks = estimate_chunks(words)
+        plan.pages_to_evaluate += 1
+        plan.llm_calls += chunks
+        plan.prompt_tokens += estimate_prompt_tokens(words, instruction_tokens)
+        plan.completion_tokens += chunks * COMPLETION_TOKENS_PER_CALL
+
+    for combo in combos_todo:
+        arguments = dict(zip(mod.combo_keys, combo))
+        values: dict = arguments.copy()
+        values.update(unis_dict[arguments["einrichtung"]])
+        query = mod.query_template.format(**values)
+        prompt = mod.prompt_template.format(**arguments)
+
+        urls = store.get_search(query)
+        if urls is None:
+            plan.searches_needed += 1
+            plan.pages_needed += MAX_URLS
+            for _ in range(MAX_URLS):
+                add_page(average_words, prompt)
+            continue
+
+        plan.searches_cached += 1
+        for url in urls[:MAX_URLS]:
+            words = store.get_page_words(url)
+            if words is None:
+                plan.pages_needed += 1
+            else:
+                plan.pages_cached += 1
+
+            verdict = store.get_verdict(url, prompt)
+            if verdict is None:
+                add_page(average_words if words is None else words, prompt)
+            else:
+                plan.verdicts_cached += 1
+                if verdict:
+                    # Der Lauf bricht nach dem ersten positiven Ergebnis ab
+                    break
+
+    return plan
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds < 3600:
+        return f"{seconds / 60:.0f} min"
+    return f"{seconds / 3600:.1f} h"
+
+
+def format_plan(plan: Plan,
+                search_workers: int = DEFAULT_SEARCH_WORKERS,
+                fetch_workers: int = DEFAULT_FETCH_WORKERS,
+                extract_workers: int = DEFAULT_EXTRACT_WORKERS,
+                workers: int = 1) -> str:
+    """ Formatiert den Plan als Bericht für die Kommandozeile, mit der Dauer für
+        `workers` Prozesse. """
+    price_input = dotenv.get_key(".env", "LLM_PRICE_INPUT")
+    price_output = dotenv.get_key(".env", "LLM_PRICE_OUTPUT")
+    if price_input and price_output:
+        cost = f"${plan.cost(float(price_input), float(price_output)):,.2f}"
+    else:
+        cost = "(set LLM_PRICE_INPUT and LLM_PRICE_OUTPUT in .env)"
+
+    stage_times = plan.wall_time(search_workers, fetch_workers, extract_workers, workers)
+    processes = f", {workers} processes" if workers > 1 else ""
+    stages = ", ".join(f"{name} {_format_duration(seconds)}" for name, seconds in stage_times.items())
+
+    return "\n".join([
+        f"Plan for {plan.modulename}",
+        f"  Combos:        {plan.combos_todo} remaining "
+        f"({plan.combos_done} of {plan.combos_total} done)",
+        f"  Google search: {plan.searches_needed} queries needed, {plan.searches_cached} cached",
+        f"  Pages:         {plan.pages_needed} to crawl, {plan.pages_cached} cached",
+        f"  LLM:           {plan.pages_to_evaluate} pages to evaluate "
+        f"({plan.verdicts_cached} cached), ~{plan.llm_calls} calls",
+        f"  Tokens:        ~{plan.prompt_tokens:,} prompt, ~{plan.completion_tokens:,} completion "
+        f"(upper bound)",
+        f"  Cost:          {cost}",
+        f"  Wall time:     ~{_format_duration(max(stage_times.values()))} ({stages}; "
+        f"{search_workers}/{fetch_workers}/{extract_workers} search/fetch/extract workers"
+        f"{processes})",
+    ])
@@ -0,0 +1,142 @@
+""" Verteilt die Seitenabrufe höflich auf die Server der Hochschulen.
+
+Pro Host laufen höchstens `per_host` Abrufe gleichzeitig, und zwischen zwei Abrufen
+desselben Hosts liegen mindestens `delay` Sekunden.  Insgesamt laufen höchstens
+`max_total` Abrufe gleichzeitig.  Der globale Platz wird erst belegt, wenn der Host frei
+ist: Ein Abruf, der auf einen ausgelasteten Server wartet, blockiert so keine Abrufe bei
+anderen Hosts.
+
+Die Einstellungen kommen aus der .env-Datei: `FETCH_PER_HOST` (Standard 2), `FETCH_DELAY`
+in Sekunden (Standard 1) und `FETCH_MAX_CONCURRENT` (Standard 16).  Sie gelten für den
+ganzen Lauf.  Im Mehrprozess-Modus teilen sich die N Worker die Plätze pro Host über
+Semaphoren im multiprocessing.Manager des Koordinators (`make_host_slots`); jeder Worker
+bekommt ein N-tel von `FETCH_MAX_CONCURRENT` und wartet N-mal so lange zwischen zwei
+Abrufen desselben Hosts (siehe `fetch_limits`). """
+import asyncio
+import time
+import zlib
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Iterable
+
+import dotenv
+
+from boilerplate import domain_of
+
+DEFAULT_PER_HOST = 2
+DEFAULT_DELAY = 1.0
+DEFAULT_MAX_TOTAL = 16
+# Anzahl der gemeinsamen Semaphoren für die Hosts im Mehrprozess-Modus.  Ein Host gehört
+# über einen Hash zu einer davon; teilen sich zwei Hosts eine, sind sie zusammen begrenzt.
+HOST_SLOT_BUCKETS = 64
+# Wartezeit zwischen zwei Versuchen, einen gemeinsamen Platz zu bekommen, in Sekunden
+HOST_SLOT_POLL = 0.1
+
+
+class DomainScheduler:
+    """ Begrenzt gleichzeitige Abrufe pro Host und insgesamt.  Eine Instanz gehört zu einer
+        Event-Loop und wird von allen Abrufen eines Prozesses geteilt.  `host_slots` sind
+        die prozessübergreifenden Semaphoren aus `make_host_slots`, falls mehrere Prozesse
+        dieselben Hosts abrufen. """
+
+    def __init__(self, per_host: int = DEFAULT_PER_HOST, delay: float = DEFAULT_DELAY,
+                 max_total: int = DEFAULT_MAX_TOTAL, host_slots: list | None = None):
+        self.per_host = per_host
+        self.delay = delay
+        self._host_slots = host_slots or []
+        self._total = asyncio.Semaphore(max_total)
+        self._hosts: dict[str, asyncio.Semaphore] = defaultdict(lambda: asyncio.Semaphore(per_host))
+        # Host -> frühester Zeitpunkt (time.monotonic) für den nächsten Abruf
+        self._next_start: dict[str, float] = defaultdict(float)
+
+    @asynccontextmanager
+    async def slot(self, url: str) -> AsyncIterator[None]:
+        """ Wartet, bis ein Abruf von `url` erlaubt ist, und hält den Platz bis zum Ende
+            des `async with`-Blocks. """
+        host = domain_of(url)
+        async with self._hosts[host]:
+            # Den Startzeitpunkt reservieren, bevor gewartet wird, damit gleichzeitige
+            # Abrufe desselben Hosts nacheinander im Abstand `delay` starten
+            now = time.monotonic()
+            start = max(now, self._next_start[host])
+            self._next_start[host] = start + self.delay
+            if start > now:
+                await asyncio.sleep(start - now)
+
+            async with self._shared_slot(host), self._total:
+                yield
+
+    @asynccontextmanager
+    async def _shared_slot(self, host: str) -> AsyncIterator[None]:
+        """ Hält den prozessübergreifenden Platz für `host`, falls es `host_slots` gibt. """
+        if not self._host_slots:
+            yield
+            return
+        semaphore = self._host_slots[zlib.crc32(host.encode("utf-8")) % len(self._host_slots)]
+        # Nicht blockierend versuchen: ein blockierendes acquire würde die Event-Loop (oder
+        # einen Thread) anhalten und ließe sich nicht abbrechen, ohne den Platz zu verlieren
+        while not semaphore.acquire(False):
+            await asyncio.sleep(HOST_SLOT_POLL)
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+def fetch_limits(workers: int = 1) -> tuple[int, float, int]:
+    """ Gibt `per_host`, `delay` und `max_total` aus der .env-Datei für einen von `workers`
+        Prozessen zurück.  `per_host` gilt für alle Prozesse zusammen (über die
+        gemeinsamen Semaphoren), der Abstand wird verlängert und `max_total` aufgeteilt,
+        damit alle Prozesse zusammen einen Host nicht stärker belasten als ein einzelner.
+        Mindestens ein Platz bleibt jedem Prozess. """
+    per_host = int(dotenv.get_key(".env", "FETCH_PER_HOST") or DEFAULT_PER_HOST)
+    delay = float(dotenv.get_key(".env", "FETCH_DELAY") or DEFAULT_DELAY)
+    max_total = int(dotenv.get_key(".env", "FETCH_MAX_CONCURRENT") or DEFAULT_MAX_TOTAL)
+    return (per_host,
+            delay * workers,
+            max(1, max_total // workers))
+
+
+def make_host_slots(manager, per_host: int) -> list:
+    """ Legt im multiprocessing.Manager `manager` die Semaphoren an, über die sich mehrere
+        Prozesse die `per_host` Plätze jedes Hosts teilen. """
+    return [manager.BoundedSemaphore(per_host) for _ in range(HOST_SLOT_BUCKETS)]
+
+
+_scheduler: DomainScheduler | None = None
+_workers = 1
+_host_slots: list | None = None
+
+
+def configure_scheduler(workers: int, host_slots: list | None = None):
+    """ Legt fest, auf wie viele Prozesse die Abruf-Grenzen aufgeteilt werden und welche
+        gemeinsamen Semaphoren die Plätze pro Host begrenzen.  Muss vor dem ersten
+        `get_scheduler` aufgerufen werden. """
+    global _workers, _host_slots
+    _workers = workers
+    _host_slots = host_slots
+
+
+def get_scheduler() -> DomainScheduler:
+    """ Gibt den Scheduler dieses Prozesses zurück und legt ihn beim ersten Aufruf an. """
+    global _scheduler
+    if _scheduler is None:
+        per_host, delay, max_total = fetch_limits(_workers)
+        _scheduler = DomainScheduler(per_host=per_host, delay=delay, max_total=max_total,
+                                     host_slots=_host_slots)
+    return _scheduler
+
+
+def interleave(combos: Iterable[tuple]) -> list[tuple]:
+    """ Sortiert die Kombinationen so, dass aufeinanderfolgende Kombinationen zu
+        verschiedenen Einrichtungen (dem ersten Schlüssel) gehören.  Die Suchergebnisse
+        einer Einrichtung liegen meist auf derselben Domain. """
+    by_institution: dict[str, list[tuple]] = defaultdict(list)
+    for combo in sorted(combos):
+        by_institution[combo[0]].append(combo)
+
+    groups = list(by_institution.values())
+    result = []
+    for i in range(max((len(group) for group in groups), default=0)):
+        result += [group[i] for group in groups if i < len(group)]
+    return result
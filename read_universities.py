@@ -1,13 +1,11 @@
 
 
 import csv
+import logging
 import os
 import re
 from typing import TypedDict
 
-from prefect import task
-from prefect.logging import get_run_logger
-
 
 class UniversityDict(TypedDict):
     """ Eine Hochschule mit Name und Webseite. """
@@ -15,11 +13,10 @@ class UniversityDict(TypedDict):
     name: str
 
 
-@task
-def read_universities(filename: str) -> list[UniversityDict]:
+def read_universities(filename: str, log: logging.Logger | logging.LoggerAdapter | None = None) -> list[UniversityDict]:
     """ Liest eine CSV-Datei mit Hochschulen ein, und gibt eine Liste der Namen und Webseiten
-        zurück. """
-    log = get_run_logger()
+        zurück.  Kommt ohne Prefect aus, damit auch `baseline.py plan` die Liste lesen kann. """
+    log = log or logging.getLogger(__name__)
 
     if not os.path.exists(filename):
         raise FileNotFoundError(f"File {filename} does not exist.")
@@ -0,0 +1,142 @@
+""" Lokaler Ergebnisspeicher in einer SQLite-Datei.
+
+Der Lauf hält hier fest, welche Suchanfragen, Seiten und LLM-Bewertungen schon vorliegen.
+`baseline.py plan` liest daraus, wie viel von einem neuen Lauf schon im Cache ist, ohne
+Prefect laden zu müssen.  Im Mehrprozess-Modus dient die Tabelle `work_queue` als
+gemeinsame Warteschlange der Worker-Prozesse.  Das Modul importiert nur die
+Standardbibliothek. """
+import json
+import sqlite3
+import threading
+
+STORE_FILE = "results.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS searches (
+    query TEXT PRIMARY KEY,
+    urls TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    url TEXT PRIMARY KEY,
+    chars INTEGER NOT NULL,
+    words INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS verdicts (
+    url TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    result INTEGER NOT NULL,
+    model TEXT,
+    PRIMARY KEY (url, prompt)
+);
+CREATE TABLE IF NOT EXISTS work_queue (
+    module TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    combo TEXT NOT NULL,
+    -- pending -> claimed -> done -> written, oder claimed -> failed
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    result TEXT,
+    PRIMARY KEY (module, seq)
+);
+"""
+
+
+class ResultStore:
+    """ Zugriff auf den Ergebnisspeicher.  Eine Instanz kann von mehreren Threads
+        benutzt werden, mehrere Prozesse öffnen jeweils ihre eigene. """
+
+    def __init__(self, path: str = STORE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        # WAL, damit Worker-Prozesse lesen können, während ein anderer schreibt
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def _execute(self, sql: str, params: tuple = ()) -> list[tuple]:
+        with self._lock, self._conn:
+            return self._conn.execute(sql, params).fetchall()
+
+    def record_search(self, query: str, urls: list[str]):
+        self._execute("INSERT OR REPLACE INTO searches (query, urls) VALUES (?, ?)",
+                      (query, json.dumps(urls)))
+
+    def get_search(self, query: str) -> list[str] | None:
+        rows = self._execute("SELECT urls FROM searches WHERE query = ?", (query,))
+        return json.loads(rows[0][0]) if rows else None
+
+    def record_page(self, url: str, markdown: str):
+        self._execute("INSERT OR REPLACE INTO pages (url, chars, words) VALUES (?, ?, ?)",
+                      (url, len(markdown), len(markdown.split())))
+
+    def get_page_words(self, url: str) -> int | None:
+        """ Gibt die Anzahl Wörter einer geladenen Seite zurück, oder None. """
+        rows = self._execute("SELECT words FROM pages WHERE url = ?", (url,))
+        return rows[0][0] if rows else None
+
+    def average_page_words(self) -> float | None:
+        rows = self._execute("SELECT AVG(words) FROM pages")
+        return rows[0][0]
+
+    def record_verdict(self, url: str, prompt: str, result: bool, model: str | None):
+        self._execute("INSERT OR REPLACE INTO verdicts (url, prompt, result, model) "
+                      "VALUES (?, ?, ?, ?)", (url, prompt, int(result), model))
+
+    def get_verdict(self, url: str, prompt: str) -> bool | None:
+        rows = self._execute("SELECT result FROM verdicts WHERE url = ? AND prompt = ?",
+                             (url, prompt))
+        return bool(rows[0][0]) if rows else None
+
+    def enqueue_combos(self, module: str, combos: list[tuple]):
+        """ Ersetzt die Warteschlange von `module` durch `combos`, in dieser Reihenfolge. """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM work_queue WHERE module = ?", (module,))
+            self._conn.executemany(
+                "INSERT INTO work_queue (module, seq, combo) VALUES (?, ?, ?)",
+                [(module, seq, json.dumps(combo)) for seq, combo in enumerate(combos)])
+
+    def claim_combo(self, module: str, worker: str) -> tuple[int, tuple] | None:
+        """ Holt die nächste offene Kombination aus der Warteschlange und vermerkt `worker`
+            als Bearbeiter.  Gibt (seq, combo) zurück, oder None, wenn nichts mehr offen ist. """
+        with self._lock:
+            # IMMEDIATE: die Schreibsperre vor dem Lesen nehmen, damit zwei Prozesse nicht
+            # dieselbe Kombination bekommen
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self._conn.execute(
+                    "UPDATE work_queue SET status = 'claimed', worker = ? "
+                    "WHERE module = ? AND seq = (SELECT seq FROM work_queue "
+                    "WHERE module = ? AND status = 'pending' ORDER BY seq LIMIT 1) "
+                    "RETURNING seq, combo", (worker, module, module)).fetchall()
+                self._conn.commit()
+            except BaseException:
+                self._conn.rollback()
+                raise
+        return (rows[0][0], tuple(json.loads(rows[0][1]))) if rows else None
+
+    def finish_combo(self, module: str, seq: int, result: dict):
+        self._execute("UPDATE work_queue SET status = 'done', result = ? "
+                      "WHERE module = ? AND seq = ?", (json.dumps(result), module, seq))
+
+    def fail_combo(self, module: str, seq: int):
+        self._execute("UPDATE work_queue SET status = 'failed' WHERE module = ? AND seq = ?",
+                      (module, seq))
+
+    def mark_written(self, module: str, seq: int):
+        self._execute("UPDATE work_queue SET status = 'written' WHERE module = ? AND seq = ?",
+                      (module, seq))
+
+    def unwritten_results(self, module: str) -> list[tuple[int, dict]]:
+        """ Ergebnisse, die ein Worker fertig hat, die aber noch nicht in der Ausgabedatei
+            stehen (z.B. weil der Koordinator abgebrochen wurde). """
+        rows = self._execute("SELECT seq, result FROM work_queue "
+                             "WHERE module = ? AND status = 'done' ORDER BY seq", (module,))
+        return [(seq, json.loads(result)) for seq, result in rows]
+
+    def queue_counts(self, module: str) -> dict[str, int]:
+        rows = self._execute("SELECT status, COUNT(*) FROM work_queue "
+                             "WHERE module = ? GROUP BY status", (module,))
+        return dict(rows)
@@ -1,42 +1,112 @@
-import json
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from typing import TYPE_CHECKING, Literal
 
 import dotenv
-from crawl4ai import (AsyncWebCrawler, CacheMode, CrawlerRunConfig,
-                      CrawlResult, LLMConfig)
-from crawl4ai.processors.pdf import (PDFContentScrapingStrategy,
-                                     PDFCrawlerStrategy)
 from prefect import task
 from prefect.cache_policies import INPUTS, TASK_SOURCE
 from prefect.logging import get_run_logger
 from prefect.artifacts import create_markdown_artifact
-from pydantic import BaseModel, TypeAdapter
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError
 
-from crawl4ai_helpers import ChunkLimitedLLMExtractionStrategy
+from boilerplate import BoilerplateFilter
+from cpu_pool import MAX_PDF_BYTES, html_to_markdown, merge_chunks, pdf_to_text, run_in_pool
+from politeness import get_scheduler
+from utils import (CHUNK_OVERLAP_RATE, CHUNK_TOKEN_THRESHOLD, DEFAULT_EXTRACT_WORKERS,
+                   WORD_TOKEN_RATE)
 
+if TYPE_CHECKING:
+    import httpx
+    from crawl4ai import AsyncWebCrawler, CrawlResult
+
+    from crawl4ai_helpers import ChunkLimitedLLMExtractionStrategy
+
+
+# Die Antwort, die das LLM für einen Chunk geben soll.  Das JSON-Schema wird dem Modell als
+# Structured Output vorgegeben, die Beschreibungen der Felder ersetzen die Formatanweisungen
+# im Prompt.  Kein Docstring: pydantic übernimmt ihn als `description` ins Schema, das mit
+# jeder Anfrage mitgeschickt wird.
+class Verdict(BaseModel):
+    model_config = ConfigDict(extra="forbid")
+
+    reasoning: str = Field(description="Kurze Begründung des Ergebnisses")
+    result: bool = Field(description="`true`, wenn der Text die Frage bejaht, sonst `false`")
+
+# Antwort des günstigen Modells in der Kaskade
+class ScreeningResult(Verdict):
+    confidence: float = Field(
+        description="Wie sicher du dir bei deinem Ergebnis bist, eine Zahl zwischen 0 und 1")
 
 class LMSResult(BaseModel):
     reasoning: str
     result: bool
     error: Literal[False] = False
 
+class UrlResult(LMSResult):
+    """ Ergebnis für einen Chunk oder eine URL, mit dem Modell, das entschieden hat. """
+    model: str | None = None
+
 class ErrorBlock(BaseModel):
     index: int
     error: Literal[True] = True
     tags: list[str]
     content: str | list[str]
 
-# @sync_compatible
-@task(cache_policy=TASK_SOURCE+INPUTS)
-async def scrape_url(url: str, prompt_template: str, arguments: dict) -> LMSResult:
+# Wird von allen Aufrufen in diesem Prozess geteilt und lernt so die wiederkehrenden
+# Blöcke jeder Domain über den ganzen Lauf hinweg.
+boilerplate_filter = BoilerplateFilter()
 
-    log = get_run_logger()
 
-    log.info(f"Scraping URL: {url} for {arguments}")
-    is_pdf = False
-    if "dumpFile" in url or url.endswith(".pdf"):
-        # hack hack hack
-        is_pdf = True
+# Tokens für die Begründung; die übrigen Felder brauchen nur wenige
+REASONING_TOKENS = 200
+
+
+def _max_tokens(schema: dict) -> int:
+    """ Obergrenze der Antwort-Tokens für ein JSON-Objekt nach `schema`. """
+    tokens = 20
+    for prop in schema["properties"].values():
+        tokens += 10 + (REASONING_TOKENS if prop.get("type") == "string" else 5)
+    return tokens
+
+
+def _is_reasoning_model(provider: str | None) -> bool:
+    model = (provider or "").rsplit("/", 1)[-1]
+    return model.startswith(("gpt-5", "o1", "o3", "o4"))
+
+
+def _extra_args(provider: str | None, schema: dict) -> dict:
+    if provider == "openai/llama-3.3-70b-instruct":
+        return {
+            "temperature": 0.0,
+            "max_tokens": _max_tokens(schema)
+        }
+    extra_args: dict = {
+        "temperature": 1,
+    }
+    # Reasoning-Modelle brauchen einen Teil der Tokens zum Nachdenken, eine knappe
+    # Grenze würde die Antwort abschneiden
+    if not _is_reasoning_model(provider):
+        extra_args["max_tokens"] = _max_tokens(schema)
+    return extra_args
+
+
+def is_pdf_url(url: str) -> bool:
+    # hack hack hack
+    return "dumpFile" in url or url.endswith(".pdf")
+
+
+def make_llm_strategy(prompt_template: str, arguments: dict,
+                      screening: bool = True,
+                      boilerplate_terms: list[str] | None = None) -> "ChunkLimitedLLMExtractionStrategy":
+    """ Baut die Extraktions-Strategie für eine Kombination aus der Konfiguration in .env.
+        Mit `screening=False` wird kein günstiges Modell vorgeschaltet.  Ohne
+        `boilerplate_terms` wird keine Boilerplate entfernt (siehe
+        BaseDefinition.boilerplate_terms). """
+    from crawl4ai import LLMConfig
+
+    from crawl4ai_helpers import (CascadeLLMExtractionStrategy,
+                                  ChunkLimitedLLMExtractionStrategy)
 
     api_key = dotenv.get_key(".env", "LLM_API_KEY")
     #base_url = "https://chat-ai.academiccloud.de/v1"
@@ -45,35 +115,137 @@ async def scrape_url(url: str, prompt_template: str, arguments: dict) -> LMSResu
 
     prompt = prompt_template.format(**arguments)
 
-    if provider == "openai/llama-3.3-70b-instruct":
-        extra_args = {
-            "temperature": 0.0,
-            "max_tokens": 800
-        }
-    else:
-        extra_args = {
-            "temperature": 1,
-            # "max_completion_tokens": 800,
-        }
+    chunking_args = dict(
+        chunk_token_threshold=CHUNK_TOKEN_THRESHOLD,
+        overlap_rate=CHUNK_OVERLAP_RATE,
+        word_token_rate=WORD_TOKEN_RATE,
+        apply_chunking=True,
+        input_format="markdown",   # or "html", "fit_markdown"
+    )
+    schema = Verdict.model_json_schema()
     llm_strategy = ChunkLimitedLLMExtractionStrategy(
         llm_config=LLMConfig(provider=provider, base_url=base_url, api_token=api_key),
-        schema=LMSResult.model_json_schema(),
+        schema=schema,
         verbose=True,
         extraction_type="schema",
         instruction=prompt,
-        chunk_token_threshold=1000,
-        overlap_rate=0.05,
-        apply_chunking=True,
-        input_format="markdown",   # or "html", "fit_markdown"
-        extra_args=extra_args,
+        extra_args=_extra_args(provider, schema),
+        boilerplate_filter=boilerplate_filter,
+        combo=tuple(arguments.values()),
+        boilerplate_terms=boilerplate_terms,
+        response_model=Verdict,
+        **chunking_args,
     )
 
-    # 2. Build the crawler config
-    scraping_strategy = PDFContentScrapingStrategy() if is_pdf else None
+    # Optional: ein günstiges Modell prüft jeden Chunk zuerst, nur positive oder
+    # unsichere Chunks gehen an das große Modell
+    screening_provider = dotenv.get_key(".env", "LLM_SCREENING_PROVIDER")
+    if screening and screening_provider:
+        min_confidence = dotenv.get_key(".env", "LLM_SCREENING_MIN_CONFIDENCE")
+        screening_schema = ScreeningResult.model_json_schema()
+        llm_strategy = CascadeLLMExtractionStrategy(
+            llm_config=LLMConfig(
+                provider=screening_provider,
+                base_url=dotenv.get_key(".env", "LLM_SCREENING_BASE_URL") or base_url,
+                api_token=dotenv.get_key(".env", "LLM_SCREENING_API_KEY") or api_key),
+            schema=screening_schema,
+            verbose=True,
+            extraction_type="schema",
+            instruction=prompt,
+            extra_args=_extra_args(screening_provider, screening_schema),
+            boilerplate_filter=boilerplate_filter,
+            combo=tuple(arguments.values()),
+            boilerplate_terms=boilerplate_terms,
+            response_model=ScreeningResult,
+            escalation_strategy=llm_strategy,
+            min_confidence=float(min_confidence or 0.8),
+            **chunking_args,
+        )
+
+    return llm_strategy
+
+
+# Eigene Threads für die blockierenden LLM-Aufrufe.  Im Standard-Executor der Event-Loop
+# würden sie die Threads von google_search und den Aufrufen des Ergebnisspeichers belegen
+# und so Suche und Laden aufhalten.
+_llm_executor: ThreadPoolExecutor | None = None
+_llm_workers = DEFAULT_EXTRACT_WORKERS
+
+
+def configure_llm_executor(max_workers: int) -> None:
+    """ Legt fest, wie viele Seiten gleichzeitig an das LLM gehen (ein Thread je Seite).
+        Muss vor dem ersten get_llm_executor() aufgerufen werden. """
+    global _llm_workers
+    _llm_workers = max_workers
+
+
+def get_llm_executor() -> ThreadPoolExecutor:
+    """ Gibt den Thread-Pool für LLM-Aufrufe zurück und legt ihn beim ersten Aufruf an. """
+    global _llm_executor
+    if _llm_executor is None:
+        _llm_executor = ThreadPoolExecutor(max_workers=_llm_workers, thread_name_prefix="llm")
+    return _llm_executor
+
+
+# Browser und HTTP-Client werden von allen Abrufen eines Prozesses geteilt, damit
+# Verbindungen (Keep-Alive) über Kombinationen hinweg wiederverwendet werden.
+# Freigegeben werden sie mit close_fetchers() am Ende eines Laufs.
+_crawler: "AsyncWebCrawler | None" = None
+_http_client: "httpx.AsyncClient | None" = None
+_crawler_lock = asyncio.Lock()
+
+
+async def _get_crawler() -> "AsyncWebCrawler":
+    global _crawler
+    # crawl4ai zieht Playwright nach sich und wird daher erst hier importiert
+    from crawl4ai import AsyncWebCrawler
+
+    async with _crawler_lock:
+        if _crawler is None:
+            crawler = AsyncWebCrawler()
+            await crawler.start()
+            _crawler = crawler
+    return _crawler
+
+
+def _get_http_client() -> "httpx.AsyncClient":
+    global _http_client
+    import httpx
+
+    if _http_client is None:
+        _http_client = httpx.AsyncClient(follow_redirects=True, timeout=60)
+    return _http_client
+
+
+async def close_fetchers() -> None:
+    """ Schließt den gemeinsamen Browser und HTTP-Client dieses Prozesses. """
+    global _crawler, _http_client
+    if _crawler is not None:
+        await _crawler.close()
+        _crawler = None
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+
+@task(cache_policy=TASK_SOURCE+INPUTS, tags=['fetch-page'])
+async def fetch_page(url: str) -> str:
+    """ Läd eine Seite (HTML oder PDF) und gibt ihren Inhalt als Markdown zurück.  Bei
+        Fehlern wird ein leerer String zurückgegeben.  Markdown-Erzeugung und
+        PDF-Textextraktion laufen im Prozess-Pool.  Wie viele Abrufe gleichzeitig und in
+        welchem Abstand laufen, regelt der Scheduler in politeness.py. """
+    log = get_run_logger()
+
+    if is_pdf_url(url):
+        return await _fetch_pdf(url)
+
+    from crawl4ai import CacheMode, CrawlerRunConfig
+
+    from crawl4ai_helpers import DeferredMarkdownGenerator
+
     crawl_config = CrawlerRunConfig(
-        scraping_strategy=scraping_strategy,  # type: ignore
-        extraction_strategy=llm_strategy,
-        cache_mode=CacheMode.DISABLED if is_pdf else CacheMode.WRITE_ONLY,
+        markdown_generator=DeferredMarkdownGenerator(),
+        cache_mode=CacheMode.WRITE_ONLY,
         verbose=True,
         log_console=True,
     )
@@ -81,9 +253,8 @@ async def scrape_url(url: str, prompt_template: str, arguments: dict) -> LMSResu
     # Create a browser config if needed
     # browser_cfg = BrowserConfig(headless=True)
 
-    crawler_strategy = PDFCrawlerStrategy() if is_pdf else None
-    
-    async with AsyncWebCrawler(crawler_strategy=crawler_strategy) as crawler:  # type: ignore
+    crawler = await _get_crawler()
+    async with get_scheduler().slot(url):
         # cast(AsyncLogger, crawler.logger).console.file = sys.stderr
         log.info("Scraping URL: %s", url)
         result = await crawler.arun(
@@ -94,72 +265,150 @@ async def scrape_url(url: str, prompt_template: str, arguments: dict) -> LMSResu
         if TYPE_CHECKING:
             assert isinstance(result, CrawlResult)
 
-        # log.info("LLM usage: %s", llm_strategy.usages)
-        # log.info("LLM usage: %s", llm_strategy.total_usage)
-        # llm_strategy.show_usage()
-
-        if not result.extracted_content:
-            log.warning("⚠️ No content extracted")
-            return LMSResult(reasoning="(No content extracted)", result=False)
-
-
-        log.info("result.error_message: %s", result.error_message)
-        # TODO: we are getting multiple blocks here, investigate if we are handing the chunks
-        # correctly
-        log.info("result.extracted_content: %s", result.extracted_content[:1000])
-
-        try:
-            data = TypeAdapter(list[LMSResult|ErrorBlock]).validate_json(
-                result.extracted_content)
-        except json.JSONDecodeError as e:
-            log.warning(f"⚠️ JSON decoding error: {e}")
-            log.warning("The extracted content might not be valid JSON.")
-            log.warning("Extracted content: %s", result.extracted_content)
-            raise
-            return LMSResult(reasoning="(JSON decoding error)", result=False)
-        except Exception as e:
-            log.warning(f"⚠️ Error validating JSON: {e}")
-            log.warning("Extracted content: %s", result.extracted_content)
-            raise
-            return LMSResult(reasoning="(Error validating JSON)", result=False)
-
-        # # combine chunks into a single reasoning
-        # chunks = []
-        # for item in data:
-        #     if isinstance(item, ErrorBlock):
-        #         raise RuntimeError(
-        #             f"Error in block {item.index}: {item.content}")
-            
-        #     chunks.append({
-        #         "result": item.result,
-        #         "reasoning": item.reasoning
-        #     })
-
-        positive: list[str] = []
-        for item in data:
-            if isinstance(item, ErrorBlock):
-                raise RuntimeError(
-                    f"Error in block {item.index}: {item.content}")
-            if item.result:
-                positive.append(item.reasoning)
-
-        usage_found = len(positive) > 0
-        if usage_found:
-            # reasoning = f"URL: {url};"
-            reasoning = "; ".join(positive)
-        else:
-            # reasoning = f"URL: {url};"
-            reasoning = "No mention found."
-
-        markdown_report = f"""
+    if not result.success or not result.cleaned_html:
+        log.warning("⚠️ Could not fetch %s: %s", url, result.error_message)
+        return ""
+    return await run_in_pool(html_to_markdown, result.cleaned_html, result.redirected_url or url)
+
+
+async def _download(url: str, max_bytes: int) -> bytes:
+    async with _get_http_client().stream("GET", url) as response:
+        response.raise_for_status()
+        data = bytearray()
+        async for chunk in response.aiter_bytes():
+            data += chunk
+            if len(data) > max_bytes:
+                raise ValueError(f"larger than {max_bytes // 2**20} MB")
+        return bytes(data)
+
+
+async def _fetch_pdf(url: str) -> str:
+    import httpx
+
+    log = get_run_logger()
+    log.info("Downloading PDF: %s", url)
+    try:
+        async with get_scheduler().slot(url):
+            data = await _download(url, MAX_PDF_BYTES)
+    except (httpx.HTTPError, ValueError) as e:
+        log.warning("⚠️ Could not fetch PDF %s: %s", url, e)
+        return ""
+
+    try:
+        return await run_in_pool(pdf_to_text, data)
+    except BrokenProcessPool:
+        # Nicht als leere Seite zurückgeben, sonst landet "" im Cache: der Task schlägt
+        # fehl, und die Kombination wird beim nächsten Lauf wiederholt
+        raise
+    except Exception as e:
+        log.warning("⚠️ Could not read PDF %s: %s", url, e)
+        return ""
+
+
+async def prepare_chunks(llm_strategy: "ChunkLimitedLLMExtractionStrategy", url: str,
+                         markdown: str) -> list[str]:
+    """ Teilt das Markdown einer Seite in die Chunks, die dem LLM gegeben werden. """
+    # Wie crawl4ai: Absätze sind die Abschnitte, die zu Chunks zusammengefasst werden.
+    # Das Zusammenfassen (inkl. Token-Zählung) läuft im Prozess-Pool.
+    sections = llm_strategy.strip_boilerplate(url, markdown.split("\n\n"))
+    chunks = await run_in_pool(
+        merge_chunks, sections,
+        chunk_token_threshold=llm_strategy.chunk_token_threshold,
+        overlap=int(llm_strategy.chunk_token_threshold * llm_strategy.overlap_rate),
+        word_token_rate=llm_strategy.word_token_rate)
+    return llm_strategy.limit_chunks(chunks)
+
+
+def combine_blocks(blocks: list[dict]) -> UrlResult:
+    """ Fasst die Antworten des LLMs für alle Chunks einer Seite zu einem Ergebnis
+        zusammen.  Bei einem Fehlerblock wird ein RuntimeError ausgelöst. """
+    data = TypeAdapter(list[UrlResult|ErrorBlock]).validate_python(blocks)
+
+    # # combine chunks into a single reasoning
+    # chunks = []
+    # for item in data:
+    #     if isinstance(item, ErrorBlock):
+    #         raise RuntimeError(
+    #             f"Error in block {item.index}: {item.content}")
+
+    #     chunks.append({
+    #         "result": item.result,
+    #         "reasoning": item.reasoning
+    #     })
+
+    positive: list[str] = []
+    # Das Modell, das entschieden hat: bei positiven Ergebnissen das der positiven
+    # Chunks, sonst das der negativen
+    positive_models: list[str] = []
+    negative_models: list[str] = []
+    for item in data:
+        if isinstance(item, ErrorBlock):
+            raise RuntimeError(
+                f"Error in block {item.index}: {item.content}")
+        models = positive_models if item.result else negative_models
+        if item.model and item.model not in models:
+            models.append(item.model)
+        if item.result:
+            positive.append(item.reasoning)
+
+    usage_found = len(positive) > 0
+    if usage_found:
+        # reasoning = f"URL: {url};"
+        reasoning = "; ".join(positive)
+    else:
+        # reasoning = f"URL: {url};"
+        reasoning = "No mention found."
+    model = ", ".join(positive_models if usage_found else negative_models) or None
+    return UrlResult(reasoning=reasoning, result=usage_found, model=model)
+
+
+@task(cache_policy=TASK_SOURCE+INPUTS, tags=['scrape-url'])
+async def extract_page(url: str, markdown: str, prompt_template: str, arguments: dict,
+                       boilerplate_terms: list[str] | None = None) -> UrlResult:
+    """ Gibt den Inhalt einer Seite chunkweise dem LLM und fasst die Antworten zusammen.
+        `boilerplate_terms` ist Teil des Cache-Schlüssels, damit ein Ergebnis mit
+        entfernter Boilerplate nicht für einen Lauf ohne wiederverwendet wird. """
+    log = get_run_logger()
+
+    log.info(f"Analyzing URL: {url} for {arguments}")
+    if not markdown:
+        log.warning("⚠️ No content extracted")
+        return UrlResult(reasoning="(No content extracted)", result=False)
+
+    llm_strategy = make_llm_strategy(prompt_template, arguments,
+                                     boilerplate_terms=boilerplate_terms)
+
+    # Die blockierenden LLM-Aufrufe laufen in einem eigenen Thread-Pool, damit die
+    # Event-Loop weiter Seiten laden kann.
+    chunks = await prepare_chunks(llm_strategy, url, markdown)
+    blocks = await asyncio.get_running_loop().run_in_executor(
+        get_llm_executor(), llm_strategy.run_chunks, url, chunks)
+
+    # log.info("LLM usage: %s", llm_strategy.usages)
+    # log.info("LLM usage: %s", llm_strategy.total_usage)
+    # llm_strategy.show_usage()
+
+    # TODO: we are getting multiple blocks here, investigate if we are handing the chunks
+    # correctly
+    log.info("extracted blocks: %s", str(blocks)[:1000])
+
+    try:
+        url_result = combine_blocks(blocks)
+    except ValidationError as e:
+        log.warning(f"⚠️ Error validating JSON: {e}")
+        log.warning("Extracted content: %s", blocks)
+        raise
+
+    markdown_report = f"""
 # Scraping Results
 - **URL:** {url}
-- **Reasoning:** {reasoning}
-- **Result:** {result}
+- **Reasoning:** {url_result.reasoning}
+- **Model:** {url_result.model}
+- **Result:** {url_result.result}
 """
-        await create_markdown_artifact(
-            markdown=markdown_report,
-            key="scrape-url-results"
-        )
+    await create_markdown_artifact(
+        markdown=markdown_report,
+        key="scrape-url-results"
+    )
 
-        return LMSResult(reasoning=reasoning, result=usage_found)
+    return url_result
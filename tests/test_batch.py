@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+pytest.importorskip("prefect")
+pytest.importorskip("crawl4ai")
+pytest.importorskip("googleapiclient")
+
+from prefect.testing.utilities import prefect_test_harness
+
+from flows.batch import batch_ingest
+
+MODULE = "openaccess"
+
+
+@pytest.fixture(scope="module", autouse=True)
+def prefect_harness():
+    with prefect_test_harness():
+        yield
+
+
+def _output_line(custom_id: str, content: str) -> dict:
+    return {"id": f"batch_req_{custom_id}", "custom_id": custom_id, "error": None,
+            "response": {"status_code": 200,
+                         "body": {"choices": [{"message": {"content": content}}]}}}
+
+
+def test_batch_ingest_skips_invalid_answers(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / ".env").write_text("LLM_PROVIDER=openai/gpt-4o-mini\nLLM_API_KEY=test\n")
+
+    manifest = [
+        {"arguments": {"einrichtung": "Uni A"}, "query": "a", "urls": ["https://uni-a.de/"],
+         "requests": [["a-0-0"]]},
+        {"arguments": {"einrichtung": "Uni B"}, "query": "b", "urls": ["https://uni-b.de/"],
+         "requests": [["b-0-0"]]},
+    ]
+    output = [
+        # Ohne `result`: passt nicht zum Schema
+        _output_line("a-0-0", '{"reasoning": "unklar"}'),
+        _output_line("b-0-0", '{"reasoning": "Policy gefunden", "result": true}'),
+    ]
+    with open(f"batch_{MODULE}_manifest.jsonl", "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(entry) + "\n" for entry in manifest)
+    with open(f"batch_{MODULE}_output.jsonl", "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(line) + "\n" for line in output)
+
+    batch_ingest(MODULE)
+
+    with open(f"results_{MODULE}.jsonlines", encoding="utf-8") as f:
+        results = [json.loads(line) for line in f]
+    assert [result["einrichtung"] for result in results] == ["Uni B"]
+    assert results[0]["result"] is True
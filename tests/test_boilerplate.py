@@ -0,0 +1,71 @@
+from types import SimpleNamespace
+
+import pytest
+
+from boilerplate import BoilerplateFilter, domain_of
+
+MENU = "Startseite | Studium | Forschung"
+
+
+def test_domain_of():
+    assert domain_of("https://www.uni-example.de/a/b") == "uni-example.de"
+
+
+def test_strips_blocks_seen_on_min_pages():
+    f = BoilerplateFilter(min_pages=3)
+    assert f.strip("https://uni.de/1", [MENU, "Seite 1"]) == [MENU, "Seite 1"]
+    assert f.strip("https://uni.de/2", [MENU, "Seite 2"]) == [MENU, "Seite 2"]
+    assert f.strip("https://uni.de/3", [MENU, "Seite 3"]) == ["Seite 3"]
+
+
+def test_same_url_is_counted_once():
+    f = BoilerplateFilter(min_pages=2)
+    f.strip("https://uni.de/1", [MENU])
+    assert f.strip("https://uni.de/1", [MENU]) == [MENU]
+
+
+def test_domains_are_separate():
+    f = BoilerplateFilter(min_pages=2)
+    f.strip("https://uni-a.de/1", [MENU])
+    assert f.strip("https://uni-b.de/1", [MENU]) == [MENU]
+
+
+def test_keep_terms():
+    f = BoilerplateFilter(min_pages=2)
+    blocks = ["Moodle-Login", MENU]
+    f.strip("https://uni.de/1", blocks, ["moodle"])
+    assert f.strip("https://uni.de/2", blocks, ["moodle"]) == ["Moodle-Login"]
+
+
+def test_drops_empty_blocks():
+    f = BoilerplateFilter()
+    assert f.strip("https://uni.de/1", ["", "  ", "Text"]) == ["Text"]
+
+
+def test_dedupe_chunks_per_combo():
+    f = BoilerplateFilter()
+    combo = ("Uni A", "Moodle")
+    assert f.dedupe_chunks(combo, ["a", "b"]) == ["a", "b"]
+    # Gleicher Chunk bis auf Leerzeichen und Groß-/Kleinschreibung
+    assert f.dedupe_chunks(combo, ["A ", "c"]) == ["c"]
+    assert f.dedupe_chunks(("Uni A", "Ilias"), ["a"]) == ["a"]
+
+
+def test_forget_combo():
+    f = BoilerplateFilter()
+    combo = ("Uni A", "Moodle")
+    f.dedupe_chunks(combo, ["a"])
+    f.forget_combo(combo)
+    assert f.dedupe_chunks(combo, ["a"]) == ["a"]
+
+
+def test_chunks_past_the_limit_are_not_marked_seen():
+    helpers = pytest.importorskip("crawl4ai_helpers")
+    f = BoilerplateFilter()
+    combo = ("Uni A", "Moodle")
+    strategy = SimpleNamespace(max_chunks=2, boilerplate_filter=f, combo=combo)
+    limit_chunks = helpers.ChunkLimitedLLMExtractionStrategy.limit_chunks
+
+    assert limit_chunks(strategy, ["a", "b", "Moodle-Login"]) == ["a", "b"]
+    # Auf der ersten URL abgeschnitten, also noch nicht bewertet
+    assert limit_chunks(strategy, ["Moodle-Login", "a"]) == ["Moodle-Login"]
@@ -0,0 +1,77 @@
+import pytest
+
+pytest.importorskip("crawl4ai")
+pytest.importorskip("prefect")
+
+from crawl4ai import LLMConfig
+
+from crawl4ai_helpers import CascadeLLMExtractionStrategy, ChunkLimitedLLMExtractionStrategy
+from tasks.scraper import ScreeningResult, Verdict
+
+
+def make_strategy(answers: list[str], model=Verdict, provider="openai/large", **kwargs):
+    strategy_class = kwargs.pop("strategy_class", ChunkLimitedLLMExtractionStrategy)
+    strategy = strategy_class(llm_config=LLMConfig(provider=provider, api_token="test"),
+                              schema=model.model_json_schema(), extraction_type="schema",
+                              instruction="Gibt es Moodle?", response_model=model, **kwargs)
+    answers = iter(answers)
+    strategy.calls = 0
+
+    def complete(url, html):
+        strategy.calls += 1
+        return next(answers)
+
+    strategy.complete = complete
+    return strategy
+
+
+def test_wrong_type_is_retried():
+    strategy = make_strategy(['{"reasoning": "Login-Seite", "result": "ja"}',
+                              '{"reasoning": "Login-Seite", "result": true}'])
+    blocks = strategy.extract("https://uni.de/", 0, "Moodle-Login")
+    assert strategy.calls == 2
+    assert blocks[0]["result"] is True and not blocks[0]["error"]
+
+
+def test_invalid_twice_gives_error_block():
+    strategy = make_strategy(['{"reasoning": "x"}', 'kein JSON'])
+    blocks = strategy.extract("https://uni.de/", 3, "text")
+    assert strategy.calls == 2
+    assert blocks[0]["error"] and blocks[0]["index"] == 3
+
+
+def make_cascade(screening_answers: list[str]):
+    large = make_strategy(['{"reasoning": "Moodle-Login gefunden", "result": true}'])
+    cascade = make_strategy(screening_answers, model=ScreeningResult, provider="openai/small",
+                            strategy_class=CascadeLLMExtractionStrategy,
+                            escalation_strategy=large, min_confidence=0.8)
+    return cascade, large
+
+
+@pytest.mark.parametrize("answers", [
+    # positiv
+    ['{"reasoning": "Login", "result": true, "confidence": 0.95}'],
+    # unsicher
+    ['{"reasoning": "unklar", "result": false, "confidence": 0.5}'],
+    # zweimal keine gültige Antwort: Fehlerblock
+    ['kein JSON', '{"reasoning": "x"}'],
+    # leere Antwort
+    ['', ''],
+])
+def test_cascade_escalates(answers):
+    cascade, large = make_cascade(answers)
+    blocks = cascade.extract("https://uni.de/", 0, "Moodle-Login")
+    assert large.calls == 1
+    assert blocks[0]["model"] == "openai/large"
+
+
+def test_cascade_keeps_confident_negative():
+    cascade, large = make_cascade(['{"reasoning": "nichts", "result": false, "confidence": 0.9}'])
+    blocks = cascade.extract("https://uni.de/", 0, "Impressum")
+    assert large.calls == 0
+    assert blocks[0]["model"] == "openai/small" and blocks[0]["result"] is False
+
+
+def test_cascade_escalates_without_blocks():
+    cascade, _ = make_cascade([])
+    assert cascade._needs_escalation([])
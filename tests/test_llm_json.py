@@ -0,0 +1,44 @@
+import pytest
+
+from llm_json import repair_json
+
+
+def test_plain_object():
+    assert repair_json('{"reasoning": "ok", "result": true}') == [{"reasoning": "ok", "result": True}]
+
+
+def test_code_fence():
+    content = 'Hier die Antwort:\n```json\n[{"reasoning": "ok", "result": false}]\n```'
+    assert repair_json(content) == [{"reasoning": "ok", "result": False}]
+
+
+def test_blocks_tags():
+    content = '<blocks>\n[{"reasoning": "Moodle", "result": true}]\n</blocks>'
+    assert repair_json(content) == [{"reasoning": "Moodle", "result": True}]
+
+
+def test_blocks_tags_uses_longest_match():
+    content = ('Format: <blocks></blocks>\n'
+               '<blocks>[{"reasoning": "a", "result": true}, {"reasoning": "b", "result": false}]</blocks>')
+    assert len(repair_json(content)) == 2
+
+
+def test_trailing_commas():
+    content = '[{"reasoning": "ok", "result": true,},]'
+    assert repair_json(content) == [{"reasoning": "ok", "result": True}]
+
+
+def test_surrounding_prose():
+    content = 'Das Ergebnis ist {"reasoning": "ok", "result": true} wie erwartet.'
+    assert repair_json(content) == [{"reasoning": "ok", "result": True}]
+
+
+def test_wrapped_list():
+    content = '{"results": [{"reasoning": "ok", "result": true}]}'
+    assert repair_json(content) == [{"reasoning": "ok", "result": True}]
+
+
+@pytest.mark.parametrize("content", [None, "", "Ja", "[1, 2]", "[]"])
+def test_no_object(content):
+    with pytest.raises(ValueError):
+        repair_json(content)
@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import time
+
+import pytest
+
+pytest.importorskip("dotenv")
+
+from politeness import DomainScheduler, interleave, make_host_slots
+
+
+async def _fetch(scheduler: DomainScheduler, url: str, running: dict, peak: dict,
+                 seconds: float = 0.05):
+    async with scheduler.slot(url):
+        running[url] = running.get(url, 0) + 1
+        peak[url] = max(peak.get(url, 0), running[url])
+        await asyncio.sleep(seconds)
+        running[url] -= 1
+
+
+def test_per_host_limit():
+    scheduler = DomainScheduler(per_host=2, delay=0, max_total=16)
+    running: dict = {}
+    peak: dict = {}
+
+    async def main():
+        await asyncio.gather(*(_fetch(scheduler, f"https://{host}/", running, peak)
+                               for host in ("uni-a.de", "uni-b.de") for _ in range(5)))
+
+    asyncio.run(main())
+    assert peak == {"https://uni-a.de/": 2, "https://uni-b.de/": 2}
+
+
+def test_global_limit():
+    scheduler = DomainScheduler(per_host=2, delay=0, max_total=3)
+    running: dict = {}
+    peak: dict = {}
+    total = {"running": 0, "peak": 0}
+
+    async def fetch(url):
+        async with scheduler.slot(url):
+            total["running"] += 1
+            total["peak"] = max(total["peak"], total["running"])
+            await asyncio.sleep(0.02)
+            total["running"] -= 1
+
+    async def main():
+        await asyncio.gather(*(fetch(f"https://uni-{i}.de/") for i in range(10)))
+
+    asyncio.run(main())
+    assert total["peak"] == 3
+
+
+def test_delay_between_fetches_of_a_host():
+    delay = 0.1
+    scheduler = DomainScheduler(per_host=4, delay=delay, max_total=16)
+    starts: dict[str, list[float]] = {}
+
+    async def fetch(url):
+        async with scheduler.slot(url):
+            starts.setdefault(url, []).append(time.monotonic())
+
+    async def main():
+        urls = ("https://uni-a.de/x", "https://www.uni-a.de/y", "https://uni-a.de/z",
+                "https://uni-b.de/")
+        await asyncio.gather(*(fetch(url) for url in urls))
+
+    asyncio.run(main())
+    # www. gehört zum selben Host
+    same_host = sorted(starts["https://uni-a.de/x"] + starts["https://www.uni-a.de/y"]
+                       + starts["https://uni-a.de/z"])
+    gaps = [b - a for a, b in zip(same_host, same_host[1:])]
+    assert all(gap >= delay * 0.8 for gap in gaps)
+    # Ein anderer Host wartet nicht auf uni-a.de
+    assert starts["https://uni-b.de/"][0] - same_host[0] < delay
+
+
+def test_interleave():
+    combos = [("Uni A", "Moodle"), ("Uni A", "Ilias"), ("Uni B", "Moodle"), ("Uni C", "Moodle"),
+              ("Uni A", "OpenOLAT")]
+    result = interleave(combos)
+    assert sorted(result) == sorted(combos)
+    assert [combo[0] for combo in result] == ["Uni A", "Uni B", "Uni C", "Uni A", "Uni A"]
+
+
+def test_interleave_empty():
+    assert interleave([]) == []
+
+
+@pytest.fixture(scope="module")
+def manager():
+    with multiprocessing.Manager() as manager:
+        yield manager
+
+
+def test_shared_host_slots_limit_all_schedulers(manager):
+    host_slots = make_host_slots(manager, per_host=1)
+    # Zwei Prozesse, hier zwei Scheduler in einer Event-Loop
+    schedulers = [DomainScheduler(per_host=1, delay=0, host_slots=host_slots) for _ in range(2)]
+    running: dict = {}
+    peak: dict = {}
+
+    async def main():
+        await asyncio.gather(*(_fetch(scheduler, "https://uni.de/", running, peak)
+                               for scheduler in schedulers for _ in range(2)))
+
+    asyncio.run(main())
+    assert peak["https://uni.de/"] == 1
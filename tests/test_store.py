@@ -0,0 +1,57 @@
+import multiprocessing
+
+from store import ResultStore
+
+MODULE = "test"
+
+
+def _claim_all(path: str, worker: str, results) -> None:
+    store = ResultStore(path)
+    claimed = []
+    while (item := store.claim_combo(MODULE, worker)) is not None:
+        claimed.append(item[0])
+    store.close()
+    results.put(claimed)
+
+
+def test_claim_combo_in_order(tmp_path):
+    store = ResultStore(str(tmp_path / "store.sqlite"))
+    store.enqueue_combos(MODULE, [("Uni A", "Moodle"), ("Uni B", "Ilias")])
+    assert store.claim_combo(MODULE, "w") == (0, ("Uni A", "Moodle"))
+    assert store.claim_combo(MODULE, "w") == (1, ("Uni B", "Ilias"))
+    assert store.claim_combo(MODULE, "w") is None
+    store.close()
+
+
+def test_finished_results_until_written(tmp_path):
+    store = ResultStore(str(tmp_path / "store.sqlite"))
+    store.enqueue_combos(MODULE, [("Uni A",), ("Uni B",)])
+    seq, _ = store.claim_combo(MODULE, "w")
+    store.finish_combo(MODULE, seq, {"result": True})
+    seq_failed, _ = store.claim_combo(MODULE, "w")
+    store.fail_combo(MODULE, seq_failed)
+    assert store.unwritten_results(MODULE) == [(seq, {"result": True})]
+    store.mark_written(MODULE, seq)
+    assert store.unwritten_results(MODULE) == []
+    assert store.queue_counts(MODULE) == {"written": 1, "failed": 1}
+    store.close()
+
+
+def test_claim_combo_is_exclusive_across_processes(tmp_path):
+    path = str(tmp_path / "store.sqlite")
+    store = ResultStore(path)
+    store.enqueue_combos(MODULE, [(f"Uni {i}",) for i in range(200)])
+    store.close()
+
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [context.Process(target=_claim_all, args=(path, f"w{i}", results))
+                 for i in range(4)]
+    for process in processes:
+        process.start()
+    claimed = [seq for _ in processes for seq in results.get(timeout=60)]
+    for process in processes:
+        process.join()
+
+    assert sorted(claimed) == list(range(200))
+    assert all(process.exitcode == 0 for process in processes)
@@ -1,7 +1,29 @@
+import json
+import os
+from contextlib import contextmanager
 from functools import wraps
 from threading import Semaphore
 from typing import Callable
 
+# Einstellungen, die sowohl der Lauf als auch `baseline.py plan` brauchen.  Dieses Modul
+# importiert nur die Standardbibliothek.
+
+# Anzahl der Suchergebnisse, die pro Kombination analysiert werden
+MAX_URLS = 5
+# Seiten, die während der Bewertung einer Seite schon vorab geladen werden.  Nach dem
+# ersten positiven Ergebnis werden keine weiteren Seiten geladen.
+FETCH_AHEAD = 1
+# Chunking der Seiten für das LLM
+CHUNK_TOKEN_THRESHOLD = 1000
+CHUNK_OVERLAP_RATE = 0.05
+WORD_TOKEN_RATE = 1.3  # wie crawl4ai
+MAX_CHUNKS = 5
+# Standardanzahl der Worker je Stufe der Pipeline
+DEFAULT_SEARCH_WORKERS = 2
+DEFAULT_FETCH_WORKERS = 4
+DEFAULT_EXTRACT_WORKERS = 8
+DEFAULT_EVALUATE_WORKERS = 2
+
 # From https://austinweisgrau.github.io/migrating-to-prefect-part-3-rate-limiting-api-calls.html
 def limit_concurrency(max_workers: int) -> Callable[[Callable], Callable]:
     """Wraps methods to implement concurrency limit
@@ -12,7 +34,7 @@ def limit_concurrency(max_workers: int) -> Callable[[Callable], Callable]:
 
     Prefect must be using a "local" task runner for this to work (the
     ConcurrentTaskRunner) and not a distributed task runner like Dask
-    or Ray.
+    or Ray. For limits across worker processes see global_limit.
 
     Usage:
       from prefect import task
@@ -33,4 +55,40 @@ def limit_concurrency(max_workers: int) -> Callable[[Callable], Callable]:
 
         return limited_concurrent_func
 
-    return pseudo_decorator
\ No newline at end of file
+    return pseudo_decorator
+
+
+# Grenzen, die für alle Worker-Prozesse zusammen gelten (`baseline.py <name> --workers N`).
+# Der Koordinator legt dafür Semaphoren in einem multiprocessing.Manager an und gibt sie
+# jedem Worker mit.
+_global_limits: dict = {}
+
+
+def set_global_limits(limits: dict) -> None:
+    """ Setzt die prozessübergreifenden Grenzen dieses Prozesses (Name -> Semaphore). """
+    _global_limits.update(limits)
+
+
+@contextmanager
+def global_limit(name: str):
+    """ Hält einen Platz der Grenze `name`, falls eine gesetzt ist.  Blockiert, darf also
+        nur in Threads benutzt werden, nicht auf der Event-Loop. """
+    semaphore = _global_limits.get(name)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+
+def read_done_combos(output_file: str, keys: tuple) -> set[tuple]:
+    """ Liest die Kombinationen, für die schon ein Ergebnis in `output_file` steht. """
+    combos_done = set()
+    if os.path.exists(output_file):
+        with open(output_file, "r", encoding="utf-8") as f:
+            objs = [json.loads(line) for line in f]
+            for obj in objs:
+                values = tuple(obj.get(k, "") for k in keys)
+                if all(values):
+                    combos_done.add(values)
+    return combos_done